@@ -17,6 +17,7 @@ INSTALLED_APPS = [
     'core',
     'products',
     'orders',
+    'recommendations',
     'rest_framework',
     'rest_framework.authtoken',
     'django.contrib.admin',
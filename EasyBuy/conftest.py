@@ -0,0 +1,54 @@
+import pytest
+from django.contrib.auth.models import User
+
+from core.models import StoreUser
+from orders.models import Order, OrderItem
+from orders.recommender.cache import get_cache
+from orders.recommender.stock import get_stock
+from products.models import Product
+
+
+@pytest.fixture
+def store_users(db, settings):
+    """A seller and three buyers; orders placed in tests don't queue incremental recommender updates."""
+    # signals queue incremental updates, which only the update tests want
+    settings.RECOMMENDER_INCREMENTAL_UPDATES = False
+    # cached recommendations and the active generation id of earlier tests
+    get_cache().backend.clear()
+    seller = User.objects.create_user(username="seller1", password="pass123")
+    seller = StoreUser.objects.create(user=seller, contact_number="+922222222222", role="seller")
+    buyers = []
+    for i in range(3):
+        user = User.objects.create_user(username=f"buyer{i}", password="pass123")
+        buyers.append(StoreUser.objects.create(user=user, contact_number=f"+92111111111{i}", role="buyer"))
+    return seller, buyers
+
+
+@pytest.fixture
+def make_products(store_users):
+    """Create products of the seller with the given names (and categories), in stock."""
+    seller, _ = store_users
+
+    def make(names, categories=None):
+        categories = categories or ["other"] * len(names)
+        products = [
+            Product.objects.create(name=name, slug=f"product-{i}", category=category, description=name,
+                                   seller=seller)
+            for i, (name, category) in enumerate(zip(names, categories))
+        ]
+        # stock known to this process from earlier tests
+        get_stock().sync()
+        return products
+    return make
+
+
+@pytest.fixture
+def complete_order(db):
+    """Place a completed order of one unit of each of the products."""
+    def complete(store_user, products):
+        order = Order.objects.create(store_user=store_user, total_amount=1, shipping_address="x",
+                                     status="COMPLETED")
+        for product in products:
+            OrderItem.objects.create(order=order, product=product, quantity=1, price_at_purchase=product.price)
+        return order
+    return complete
@@ -0,0 +1,35 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from core.models import StoreUser
+from orders.recommender.recommender import Recommender, MODEL_PATH
+
+
+class Command(BaseCommand):
+    help = "Precompute recommendations for many users at once and write them as JSON lines"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', type=str, required=True,
+                            help="File to write, one {\"store_user_id\", \"product_ids\"} object per line")
+        parser.add_argument('--users', type=int, nargs='*',
+                            help="StoreUser ids to score (default: every user)")
+        parser.add_argument('--top-n', type=int, default=10)
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help="Users scored per matrix product")
+        parser.add_argument('--path', type=str, default=MODEL_PATH)
+
+    def handle(self, *args, **options):
+        model = Recommender.load(options['path'])
+        user_ids = options['users'] or list(StoreUser.objects.values_list('id', flat=True).order_by('id'))
+
+        written = 0
+        with open(options['output'], 'w') as f:
+            for recs in model.iter_recommendations(user_ids, top_n=options['top_n'],
+                                                   chunk_size=options['chunk_size']):
+                f.writelines(json.dumps({'store_user_id': uid, 'product_ids': pids}) + '\n'
+                             for uid, pids in recs.items())
+                written += len(recs)
+
+        self.stdout.write(self.style.SUCCESS(
+            "Wrote recommendations for %s users to %s" % (written, options['output'])))
@@ -0,0 +1,67 @@
+import json
+import multiprocessing
+
+from django.core.management.base import BaseCommand
+
+from orders.recommender.benchmark import environment, run_benchmark
+from orders.recommender.index import DEFAULT_TOP_K
+from orders.recommender.recommender import BACKENDS
+
+
+class Command(BaseCommand):
+    help = "Benchmark recommender build and serving on synthetic catalogs (no database needed)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10000],
+                            help="Catalog sizes to benchmark, e.g. --sizes 10000 100000 1000000")
+        parser.add_argument('--users', type=int, default=None,
+                            help="Synthetic users per run (default: as many as products)")
+        parser.add_argument('--interactions-per-user', type=int, default=20)
+        parser.add_argument('--requests', type=int, default=1000,
+                            help="Timed calls per serving method")
+        parser.add_argument('--top-k', type=int, default=DEFAULT_TOP_K)
+        parser.add_argument('--workers', type=int, default=1)
+        parser.add_argument('--block-size', type=int, default=None)
+        parser.add_argument('--content-ann', action='store_true',
+                            help="Use LSH content neighbors, needed for catalogs beyond ~100k products")
+        parser.add_argument('--backends', nargs='+', choices=BACKENDS, default=['itemknn'],
+                            help="Collaborative backends to compare, e.g. --backends itemknn als")
+        parser.add_argument('--quantize', action='store_true',
+                            help="Store neighbor scores as uint8 with a per-product scale")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', type=str, default=None,
+                            help="JSON file to write (default: stdout)")
+
+    def handle(self, *args, **options):
+        params = {
+            'n_users': options['users'],
+            'interactions_per_user': options['interactions_per_user'],
+            'n_requests': options['requests'],
+            'top_k': options['top_k'],
+            'block_size': options['block_size'],
+            'workers': options['workers'],
+            'content_ann': options['content_ann'],
+            'quantize': options['quantize'],
+            'random_state': options['seed'],
+        }
+        results = environment()
+        results['runs'] = []
+        for size in options['sizes']:
+            for backend in options['backends']:
+                self.stderr.write("Benchmarking %s products with %s..." % (size, backend))
+                results['runs'].append(self._run(size, dict(params, backend=backend)))
+
+        report = json.dumps(results, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(report + '\n')
+            self.stderr.write(self.style.SUCCESS("Wrote benchmark results to %s" % options['output']))
+        else:
+            self.stdout.write(report)
+
+    def _run(self, size, params):
+        # peak RSS never goes down, so every size runs in a fresh process where fork is available
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            return run_benchmark(size, **params)
+        with multiprocessing.get_context('fork').Pool(1) as pool:
+            return pool.apply(run_benchmark, (size,), params)
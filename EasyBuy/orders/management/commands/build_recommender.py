@@ -0,0 +1,2 @@
+# the command lives next to the recommender it builds
+from orders.recommender.build_recommender import Command  # noqa: F401
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from orders.recommender.baskets import MIN_COUNT, MIN_LIFT, TOP_N, mine_associations
+
+
+class Command(BaseCommand):
+    help = "Mine frequently-bought-together rules from all completed orders"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-count', type=int, default=MIN_COUNT,
+                            help="Orders a set of products must appear in together to form a rule")
+        parser.add_argument('--min-lift', type=float, default=MIN_LIFT)
+        parser.add_argument('--top-n', type=int, default=TOP_N, help="Rules kept per product (or pair)")
+        parser.add_argument('--triples', action='store_true', help="Also mine {a, b} -> c rules")
+
+    def handle(self, *args, **options):
+        rules = mine_associations(min_count=options['min_count'], min_lift=options['min_lift'],
+                                  top_n=options['top_n'], triples=options['triples'])
+        self.stdout.write(self.style.SUCCESS("Stored %s co-purchase rules" % rules))
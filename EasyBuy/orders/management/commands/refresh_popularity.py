@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from orders.recommender.popularity import refresh_popularity
+
+
+class Command(BaseCommand):
+    help = ("Recompute the time-decayed product popularity table from all completed orders; "
+            "run it periodically (e.g. daily) so scores are rebased onto a recent epoch")
+
+    def handle(self, *args, **options):
+        scored = refresh_popularity()
+        self.stdout.write(self.style.SUCCESS("Scored popularity of %s products" % scored))
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from orders.recommender.artifact import MODEL_PATH
+from orders.recommender.incremental import process_updates
+
+UPDATE_INTERVAL = 2.0
+
+
+class Command(BaseCommand):
+    help = "Apply the queued incremental recommender updates (users who ordered/reviewed, edited products)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', type=str, default=MODEL_PATH)
+        parser.add_argument('--loop', action='store_true',
+                            help="Keep running, draining the queue every --interval seconds")
+        parser.add_argument('--interval', type=float, default=UPDATE_INTERVAL,
+                            help="Seconds between runs with --loop; updates queued meanwhile cost one artifact write")
+
+    def handle(self, *args, **options):
+        while True:
+            result = process_updates(options['path'])
+            if result['users'] or result['products'] or not options['loop']:
+                self.stdout.write("Updated %(users)s users and %(products)s products, %(rows)s neighbor rows" % result)
+            if not options['loop']:
+                return
+            close_old_connections()
+            time.sleep(options['interval'])
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.7 on 2026-10-18 15:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0003_productassociation'),
+        ('products', '0004_review'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductFeatures',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='features', serialize=False, to='products.product')),
+                ('text_hash', models.CharField(max_length=40)),
+                ('indices', models.BinaryField()),
+                ('counts', models.BinaryField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
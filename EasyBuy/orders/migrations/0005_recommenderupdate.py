@@ -0,0 +1,25 @@
+# Generated by Django 5.2.7 on 2026-10-18 16:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0004_productfeatures'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecommenderUpdate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('user', 'User'), ('product', 'Product')], max_length=10)),
+                ('object_id', models.BigIntegerField()),
+                ('queued_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('kind', 'object_id'), name='recommender_update_unique')],
+            },
+        ),
+    ]
@@ -76,4 +76,89 @@ class OrderItem(models.Model):
     price_at_purchase = models.DecimalField(max_digits=10, decimal_places=2, blank=False, null=False)  # Price of the product at the time of purchase
 
     def __str__(self):
-        return f'{self.quantity} x {self.product.name} in Order {self.order.id}'
\ No newline at end of file
+        return f'{self.quantity} x {self.product.name} in Order {self.order.id}'
+
+class ProductPopularity(models.Model):
+    """Materialized, time-decayed purchase count of a product (see recommender/popularity.py)."""
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='popularity')
+    # copied from the product so per-category rankings are served from one index
+    category = models.CharField(max_length=50, default='', null=False)
+    score = models.FloatField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-score']
+        indexes = [
+            models.Index(fields=['-score'], name='popularity_score_idx'),
+            models.Index(fields=['category', '-score'], name='popularity_category_score_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.product_id} ({self.category}) scores {self.score}'
+
+class PopularityEpoch(models.Model):
+    """The single time ProductPopularity scores are weighted relative to (see recommender/popularity.py)."""
+    epoch = models.DateTimeField()
+
+    def __str__(self):
+        return f'Popularity scored relative to {self.epoch}'
+
+class ProductAssociation(models.Model):
+    """
+    Co-purchase rule mined from completed orders (see recommender/baskets.py):
+    baskets holding `antecedent` (and `with_product`, for triple rules) also hold `consequent`.
+    """
+    antecedent = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    # second antecedent of a {antecedent, with_product} -> consequent rule, null for pair rules
+    with_product = models.ForeignKey(Product, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    consequent = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='bought_with')
+    count = models.PositiveIntegerField()
+    support = models.FloatField()
+    confidence = models.FloatField()
+    lift = models.FloatField()
+    # 0 is the strongest rule of its antecedent
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['antecedent', 'with_product', 'rank'], name='association_antecedent_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.antecedent_id} -> {self.consequent_id} ({self.confidence:.2f}, lift {self.lift:.2f})'
+
+class ProductFeatures(models.Model):
+    """Hashed term counts of a product's text, the recommender's content features (see recommender/features.py)."""
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='features')
+    # sha1 of the text and vectorizer settings the counts were computed from, a row is only recomputed
+    # when either changes
+    text_hash = models.CharField(max_length=40)
+    # int32 hashed term ids and their float32 counts
+    indices = models.BinaryField()
+    counts = models.BinaryField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'Features of {self.product_id} ({len(self.indices) // 4} terms)'
+
+class RecommenderUpdate(models.Model):
+    """
+    A user or product whose recommender data changed since the artifact was published
+    (see recommender/updates.py). Queued by signal handlers, drained by `update_recommender`.
+    """
+    USER = 'user'
+    PRODUCT = 'product'
+    KIND_CHOICES = [(USER, 'User'), (PRODUCT, 'Product')]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    queued_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            # repeated changes to one user or product before the next run are one update
+            models.UniqueConstraint(fields=['kind', 'object_id'], name='recommender_update_unique'),
+        ]
+
+    def __str__(self):
+        return f'{self.kind} {self.object_id} queued at {self.queued_at}'
@@ -0,0 +1,100 @@
+"""
+Implicit-feedback matrix factorization (weighted ALS, Hu, Koren & Volinsky 2008).
+
+Each interaction r_ui becomes a preference of 1 with confidence 1 + alpha * r_ui; every unseen
+pair is a preference of 0 with confidence 1. Instead of solving one f x f system per user and
+item, every sweep takes a few conjugate-gradient steps from the previous factors (Takács et al.
+2011). The CG steps of a whole block of rows are computed together as dense matrix products,
+so the work runs on all cores through NumPy's BLAS.
+"""
+import numpy as np
+from scipy import sparse
+
+from .serving import ALPHA, fold_in_user
+
+FACTORS = 64
+REGULARIZATION = 0.05
+ITERATIONS = 15
+CG_STEPS = 3
+# rows solved together; memory is about block nnz x factors floats
+BLOCK_ROWS = 10000
+
+
+def gram(factors, regularization):
+    """F^T F + regularization * I, the part of every normal equation shared by all rows."""
+    return factors.T @ factors + regularization * np.eye(factors.shape[1], dtype=factors.dtype)
+
+
+def solve_rows(confidence, other, other_gram, init, cg_steps=CG_STEPS, block_rows=BLOCK_ROWS):
+    """
+    Factors for every row of `confidence` given the fixed factors of the other side.
+
+    confidence: (n_rows x len(other)) CSR matrix of alpha * r values
+    other_gram: gram(other, regularization)
+    init: (n_rows x f) starting factors, the previous sweep's solution
+    """
+    confidence = sparse.csr_matrix(confidence, dtype=np.float32)
+    result = np.array(init, dtype=np.float32)
+    for start in range(0, confidence.shape[0], block_rows):
+        block = confidence[start:start + block_rows]
+        rows = np.repeat(np.arange(block.shape[0]), np.diff(block.indptr))
+        observed = other[block.indices]
+
+        def product(v):
+            # A v = v (Y^T Y + reg I) + sum over observed items of alpha * r * (y . v) y
+            dots = np.einsum('ij,ij->i', v[rows], observed) * block.data
+            return v @ other_gram + sparse.csr_matrix((dots, block.indices, block.indptr), shape=block.shape) @ other
+
+        x = result[start:start + block_rows]
+        b = sparse.csr_matrix((1 + block.data, block.indices, block.indptr), shape=block.shape) @ other
+        r = b - product(x)
+        p = r.copy()
+        rs = np.einsum('ij,ij->i', r, r)
+        for _ in range(cg_steps):
+            ap = product(p)
+            pap = np.einsum('ij,ij->i', p, ap)
+            step = np.divide(rs, pap, out=np.zeros_like(rs), where=pap > 1e-12)
+            x += step[:, None] * p
+            r -= step[:, None] * ap
+            rs_new = np.einsum('ij,ij->i', r, r)
+            p = r + np.divide(rs_new, rs, out=np.zeros_like(rs), where=rs > 1e-12)[:, None] * p
+            rs = rs_new
+        result[start:start + block_rows] = x
+    return result
+
+
+def item_arrays(item_factors, regularization):
+    """Arrays saved with a factorized model; the gram matrix is precomputed for fold-in."""
+    return {'item_factors': item_factors, 'item_gram': gram(item_factors, regularization)}
+
+
+def implicit_als(interactions, factors=FACTORS, regularization=REGULARIZATION, alpha=ALPHA,
+                 iterations=ITERATIONS, cg_steps=CG_STEPS, random_state=0):
+    """
+    Factorize a (n_users x n_items) sparse interaction matrix.
+    Returns (user_factors, item_factors) as float32 arrays of shape (n, factors).
+    """
+    confidence = sparse.csr_matrix(interactions, dtype=np.float32) * alpha
+    confidence_t = confidence.T.tocsr()
+    rng = np.random.default_rng(random_state)
+    users = (rng.standard_normal((confidence.shape[0], factors)) * 0.01).astype(np.float32)
+    items = (rng.standard_normal((confidence.shape[1], factors)) * 0.01).astype(np.float32)
+    for _ in range(iterations):
+        users = solve_rows(confidence, items, gram(items, regularization), users, cg_steps)
+        items = solve_rows(confidence_t, users, gram(users, regularization), items, cg_steps)
+    return users, items
+
+
+def fold_in(seeds, item_factors, item_gram, alpha=ALPHA):
+    """
+    Factors of users that were not part of training, from a (n_users x n_items) sparse matrix
+    of their interactions, without touching the item factors (see serving.fold_in_user).
+    """
+    seeds = sparse.csr_matrix(seeds, dtype=np.float32)
+    users = np.zeros((seeds.shape[0], item_factors.shape[1]), dtype=np.float32)
+    for u in range(seeds.shape[0]):
+        start, end = seeds.indptr[u], seeds.indptr[u + 1]
+        if start == end:
+            continue
+        users[u] = fold_in_user(seeds.indices[start:end], alpha * seeds.data[start:end], item_factors, item_gram)
+    return users
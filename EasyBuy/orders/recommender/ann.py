@@ -0,0 +1,90 @@
+"""
+Approximate content neighbors with random-projection LSH.
+
+Products are hashed into buckets by the signs of their TF-IDF vectors projected on random
+hyperplanes (one hash table per set of planes). Only products sharing a bucket in some table
+are compared exactly, so the cost grows with n_items x bucket_size instead of n_items^2.
+"""
+import numpy as np
+from scipy import sparse
+from sklearn.metrics.pairwise import cosine_similarity
+
+from .index import top_k_rows
+
+
+def _top_k_triples(rows, cols, scores, k, n_items):
+    """Keep the k best (col, score) entries of every row of a COO triple list, dropping duplicates."""
+    _, first = np.unique(rows * n_items + cols, return_index=True)
+    rows, cols, scores = rows[first], cols[first], scores[first]
+    order = np.lexsort((-scores, rows))
+    rows, cols, scores = rows[order], cols[order], scores[order]
+    rank = np.arange(len(rows)) - np.searchsorted(rows, rows, side='left')
+    keep = rank < k
+    return rows[keep], cols[keep], scores[keep]
+
+
+def lsh_neighbors(X, k, n_tables=16, bucket_size=1024, max_bucket=4096, random_state=0):
+    """
+    Approximate top-k cosine neighbors of every row of the L2-normalised matrix X.
+
+    n_tables: more tables raise recall, cost grows linearly
+    bucket_size: target number of items per bucket, sets the number of hyperplanes per table;
+                 larger buckets raise recall at the cost of more exact comparisons
+    max_bucket: buckets larger than this (e.g. near-duplicate texts) are compared in chunks
+    Returns a sparse (n_items x n_items) CSR matrix with at most k entries per row.
+    """
+    n_items = X.shape[0]
+    n_bits = max(1, int(np.ceil(np.log2(max(n_items / bucket_size, 2)))))
+    weights = 1 << np.arange(n_bits, dtype=np.int64)
+    rng = np.random.default_rng(random_state)
+
+    rows = np.empty(0, dtype=np.int64)
+    cols = np.empty(0, dtype=np.int64)
+    scores = np.empty(0, dtype=np.float32)
+    for _ in range(n_tables):
+        planes = rng.standard_normal((X.shape[1], n_bits)).astype(np.float32)
+        codes = (np.asarray(X @ planes) > 0) @ weights
+        order = np.argsort(codes, kind='stable')
+        bounds = np.flatnonzero(np.diff(codes[order])) + 1
+
+        new_rows, new_cols, new_scores = [rows], [cols], [scores]
+        for members in np.split(order, bounds):
+            for start in range(0, len(members), max_bucket):
+                chunk = members[start:start + max_bucket]
+                if len(chunk) < 2:
+                    continue
+                sim = np.asarray((X[chunk] @ X[chunk].T).todense(), dtype=np.float32)
+                np.fill_diagonal(sim, 0)
+                # keep only each member's top-k inside the bucket before merging across tables
+                kk = min(k, len(chunk) - 1)
+                top = np.argpartition(-sim, kk - 1, axis=1)[:, :kk]
+                top_scores = np.take_along_axis(sim, top, axis=1).ravel()
+                keep = top_scores > 0
+                new_rows.append(np.repeat(chunk, kk)[keep])
+                new_cols.append(chunk[top].ravel()[keep])
+                new_scores.append(top_scores[keep])
+        rows, cols, scores = _top_k_triples(np.concatenate(new_rows), np.concatenate(new_cols),
+                                            np.concatenate(new_scores), k, n_items)
+
+    return sparse.csr_matrix((scores, (rows, cols)), shape=(n_items, n_items), dtype=np.float32)
+
+
+def recall_report(X, approx, k, sample_size=200, random_state=0):
+    """
+    Compare the approximate neighbors of a random sample of items with their exact top-k.
+    recall_at_k is the share of exact neighbors that the approximate index also found.
+    """
+    n_items = X.shape[0]
+    rng = np.random.default_rng(random_state)
+    sample = np.sort(rng.choice(n_items, size=min(sample_size, n_items), replace=False))
+    exact = top_k_rows(cosine_similarity(X[sample], X), k, positions=sample)
+
+    hits = total = 0
+    for pos, (idx, _) in zip(sample.tolist(), exact):
+        hits += len(np.intersect1d(idx, approx[pos].indices))
+        total += len(idx)
+    return {
+        'recall_at_k': hits / total if total else 1.0,
+        'k': k,
+        'sample_size': len(sample),
+    }
@@ -0,0 +1,194 @@
+"""
+On-disk recommender artifact: one raw .npy file per array plus a small JSON manifest.
+
+Arrays are opened with numpy memory mapping, so every worker process shares the same
+page-cache copy and loading is O(1) in model size. The manifest is written last and
+removed first, so a reader never sees a manifest describing half-written arrays.
+
+publish_artifact keeps every model version in its own immutable directory under the model
+path and flips a CURRENT pointer file with an atomic rename, so serving processes can pick up
+a new version (see registry.py) while requests still running on the old one keep their maps.
+"""
+import json
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+MODEL_PATH = os.path.join('models', 'recommender')
+
+FORMAT_NAME = 'easybuy-recommender'
+FORMAT_VERSION = 1
+MANIFEST_NAME = 'manifest.json'
+CURRENT_NAME = 'CURRENT'
+# published versions kept on disk besides the current one, for workers still serving them
+KEEP_VERSIONS = 2
+
+
+class ArtifactError(ValueError):
+    """Raised when an artifact is incomplete, corrupt or written in an unknown format version."""
+
+
+@contextmanager
+def artifact_lock(path):
+    """
+    Hold an exclusive lock on the artifact directory while reading and rewriting it,
+    so a full build and incremental updates from several workers never interleave.
+    """
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, '.lock'), 'w') as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _replace_atomically(tmp_path, path):
+    with open(tmp_path, 'rb') as f:
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def new_version():
+    """A version name: the current UTC time, so names sort chronologically."""
+    return datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%fZ')
+
+
+def write_artifact(path, arrays, meta=None):
+    """
+    Write arrays (name -> ndarray) and meta (JSON-serialisable dict) into the directory path.
+    Returns the manifest that was written.
+    """
+    os.makedirs(path, exist_ok=True)
+    manifest_path = os.path.join(path, MANIFEST_NAME)
+    # invalidate the previous artifact before touching any array file
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+
+    entries = {}
+    for name, arr in arrays.items():
+        arr = np.ascontiguousarray(arr)
+        filename = '%s.npy' % name
+        tmp_path = os.path.join(path, filename + '.tmp')
+        with open(tmp_path, 'wb') as f:
+            np.save(f, arr, allow_pickle=False)
+        _replace_atomically(tmp_path, os.path.join(path, filename))
+        entries[name] = {'file': filename, 'dtype': arr.dtype.str, 'shape': list(arr.shape)}
+
+    manifest = {
+        'format': FORMAT_NAME,
+        'version': FORMAT_VERSION,
+        'model_version': new_version(),
+        'arrays': entries,
+        'meta': meta or {},
+    }
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    _replace_atomically(tmp_path, manifest_path)
+    return manifest
+
+
+def publish_artifact(path, arrays, meta=None, keep=KEEP_VERSIONS):
+    """
+    Write a new model version into its own directory under path, then point CURRENT at it.
+    The version is written to a temporary directory and renamed into place, so a reader only
+    ever sees complete versions. Call under artifact_lock(path). Returns the manifest.
+    """
+    os.makedirs(path, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix='.tmp-', dir=path)
+    try:
+        os.chmod(tmp_dir, 0o755)
+        manifest = write_artifact(tmp_dir, arrays, meta=meta)
+        os.rename(tmp_dir, os.path.join(path, manifest['model_version']))
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    pointer = os.path.join(path, CURRENT_NAME)
+    with open(pointer + '.tmp', 'w') as f:
+        f.write(manifest['model_version'])
+    _replace_atomically(pointer + '.tmp', pointer)
+    _prune_versions(path, manifest['model_version'], keep)
+    return manifest
+
+
+def _prune_versions(path, current, keep):
+    # version names are UTC timestamps, so they sort chronologically
+    versions = sorted(name for name in os.listdir(path)
+                      if name != current and os.path.isfile(os.path.join(path, name, MANIFEST_NAME)))
+    stale = versions[:max(len(versions) - keep, 0)]
+    # leftovers of writers that crashed; live writers hold the artifact lock, so none are running
+    stale += [name for name in os.listdir(path) if name.startswith('.tmp-')]
+    for name in stale:
+        # open memory maps of a removed version stay valid until the worker drops them
+        shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+
+
+def current_version(path):
+    """Name of the published version in path. Raises FileNotFoundError if nothing was published."""
+    try:
+        with open(os.path.join(path, CURRENT_NAME)) as f:
+            version = f.read().strip()
+    except FileNotFoundError:
+        raise FileNotFoundError("No recommender artifact at %s" % path)
+    if not version:
+        raise ArtifactError("Empty %s pointer in %s" % (CURRENT_NAME, path))
+    return version
+
+
+def resolve_artifact(path):
+    """Directory holding the arrays of path: its current version if path holds published versions."""
+    if os.path.exists(os.path.join(path, CURRENT_NAME)):
+        return os.path.join(path, current_version(path))
+    return path
+
+
+def read_manifest(path):
+    path = resolve_artifact(path)
+    manifest_path = os.path.join(path, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        raise FileNotFoundError("No recommender artifact at %s" % path)
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    except ValueError as e:
+        raise ArtifactError("Corrupt manifest in %s: %s" % (path, e))
+
+    if manifest.get('format') != FORMAT_NAME:
+        raise ArtifactError("%s is not a recommender artifact" % path)
+    if manifest.get('version') != FORMAT_VERSION:
+        raise ArtifactError("Unsupported artifact version %s (expected %s)" % (manifest.get('version'), FORMAT_VERSION))
+    return manifest
+
+
+def read_artifact(path, mmap=True):
+    """
+    Open the artifact in path (its current version if path holds published versions).
+    Returns (arrays, manifest); arrays are read-only memory maps unless mmap is False.
+    Every array is checked against the dtype and shape in the manifest.
+    """
+    path = resolve_artifact(path)
+    manifest = read_manifest(path)
+    arrays = {}
+    for name, entry in manifest['arrays'].items():
+        file_path = os.path.join(path, entry['file'])
+        try:
+            arr = np.load(file_path, mmap_mode='r' if mmap else None, allow_pickle=False)
+        except (OSError, ValueError) as e:
+            raise ArtifactError("Cannot read array %r of %s: %s" % (name, path, e))
+        if arr.dtype.str != entry['dtype'] or list(arr.shape) != entry['shape']:
+            raise ArtifactError("Array %r of %s does not match its manifest" % (name, path))
+        arrays[name] = arr
+    return arrays, manifest
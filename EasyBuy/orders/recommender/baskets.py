@@ -0,0 +1,126 @@
+"""
+Frequently-bought-together rules mined from completed orders.
+
+Every completed order is a basket. With B the binary (baskets x products) matrix, B^T B counts
+the baskets holding every pair of products in one sparse product, so no candidate itemsets
+are enumerated. For a rule a -> c:
+
+    support    = baskets with a and c / all baskets
+    confidence = baskets with a and c / baskets with a
+    lift       = confidence / (baskets with c / all baskets)
+
+Triple rules {a, b} -> c are counted the same way, only for pairs that are frequent themselves
+(any superset of an infrequent pair is infrequent): the rows of B^T for a and b are multiplied
+to get the baskets holding both, then multiplied by B.
+
+The best rules of every antecedent are stored in the ProductAssociation table and served with
+one indexed query (serving.bought_together).
+"""
+import numpy as np
+from scipy import sparse
+from django.db import transaction
+
+from orders.models import OrderItem, ProductAssociation
+from .interactions import CHUNK_SIZE, _stream_rows
+
+MIN_COUNT = 2
+MIN_LIFT = 1.0
+TOP_N = 10
+# frequent pairs expanded into triples at a time; memory is about block x basket size
+PAIR_BLOCK = 10000
+
+
+def load_baskets(chunk_size=CHUNK_SIZE):
+    """
+    Stream the products of every completed order into a binary baskets x products CSR matrix.
+    Returns (product_ids, baskets); product_ids is sorted and maps columns to Product ids.
+    """
+    queryset = (OrderItem.objects.filter(order__status='COMPLETED', product__isnull=False)
+                .values_list('order_id', 'product_id'))
+    chunks = list(_stream_rows(queryset, chunk_size))
+    data = np.concatenate(chunks) if chunks else np.empty((0, 2), dtype=np.int64)
+    order_ids, rows = np.unique(data[:, 0], return_inverse=True)
+    product_ids, cols = np.unique(data[:, 1], return_inverse=True)
+    baskets = sparse.csr_matrix((np.ones(len(data), dtype=np.int32), (rows, cols)),
+                                shape=(len(order_ids), len(product_ids)))
+    # a product listed twice in one order is still one basket
+    baskets.data[:] = 1
+    return product_ids, baskets
+
+
+def _score(groups, antecedent, with_product, consequent, count, antecedent_count, item_count,
+           n_baskets, min_lift, top_n):
+    """Metrics of candidate rules, keeping the top_n by confidence (then lift) of every group."""
+    confidence = count / antecedent_count
+    lift = confidence * n_baskets / item_count[consequent]
+    keep = lift > min_lift
+    rule = {
+        'antecedent': antecedent[keep], 'with_product': with_product[keep], 'consequent': consequent[keep],
+        'count': count[keep], 'support': count[keep] / n_baskets,
+        'confidence': confidence[keep], 'lift': lift[keep],
+    }
+    groups = groups[keep]
+    order = np.lexsort((-rule['lift'], -rule['confidence'], groups))
+    groups = groups[order]
+    rank = np.arange(len(order)) - np.searchsorted(groups, groups, side='left')
+    keep = rank < top_n
+    rule = {name: values[order][keep] for name, values in rule.items()}
+    rule['rank'] = rank[keep]
+    return rule
+
+
+def mine_rules(baskets, min_count=MIN_COUNT, min_lift=MIN_LIFT, top_n=TOP_N, triples=False,
+               pair_block=PAIR_BLOCK):
+    """
+    Co-purchase rules of a binary (baskets x products) CSR matrix, as a dict of equal-length
+    arrays: antecedent, with_product (-1 for pair rules), consequent (column positions), count,
+    support, confidence, lift and rank (0 = strongest rule of its antecedent).
+
+    min_count: baskets an itemset must appear in to form a rule
+    min_lift: only rules with a lift above it (1 = independent purchases) are kept
+    """
+    n_baskets = baskets.shape[0]
+    item_count = np.asarray(baskets.sum(axis=0)).ravel()
+    co = (baskets.T @ baskets).tocoo()
+    keep = (co.row != co.col) & (co.data >= min_count)
+    a, c, count = co.row[keep].astype(np.int64), co.col[keep].astype(np.int64), co.data[keep]
+    rules = [_score(a, a, np.full(len(a), -1), c, count, item_count[a], item_count,
+                    n_baskets, min_lift, top_n)]
+
+    if triples:
+        upper = a < c
+        first, second, pair_count = a[upper], c[upper], count[upper]
+        baskets_t = baskets.T.tocsr()
+        for start in range(0, len(first), pair_block):
+            block = slice(start, start + pair_block)
+            both = baskets_t[first[block]].multiply(baskets_t[second[block]]).tocsr()
+            counts = (both @ baskets).tocoo()
+            pair = counts.row.astype(np.int64)
+            pa, pb = first[block][pair], second[block][pair]
+            keep = (counts.col != pa) & (counts.col != pb) & (counts.data >= min_count)
+            pair = pair[keep]
+            rules.append(_score(start + pair, pa[keep], pb[keep], counts.col[keep].astype(np.int64),
+                                counts.data[keep], pair_count[block][pair], item_count,
+                                n_baskets, min_lift, top_n))
+
+    return {name: np.concatenate([r[name] for r in rules]) for name in rules[0]}
+
+
+def mine_associations(min_count=MIN_COUNT, min_lift=MIN_LIFT, top_n=TOP_N, triples=False, batch_size=5000):
+    """Recompute the ProductAssociation table from all completed orders. Returns the number of rules."""
+    product_ids, baskets = load_baskets()
+    rules = mine_rules(baskets, min_count=min_count, min_lift=min_lift, top_n=top_n, triples=triples)
+    with_product = np.where(rules['with_product'] >= 0, product_ids[rules['with_product']], -1)
+    rows = zip(product_ids[rules['antecedent']].tolist(), with_product.tolist(),
+               product_ids[rules['consequent']].tolist(), rules['count'].tolist(), rules['support'].tolist(),
+               rules['confidence'].tolist(), rules['lift'].tolist(), rules['rank'].tolist())
+    with transaction.atomic():
+        ProductAssociation.objects.all().delete()
+        ProductAssociation.objects.bulk_create(
+            (ProductAssociation(antecedent_id=a, with_product_id=b if b >= 0 else None, consequent_id=c,
+                                count=n, support=s, confidence=conf, lift=lift, rank=rank)
+             for a, b, c, n, s, conf, lift, rank in rows),
+            batch_size=batch_size,
+        )
+    return len(rules['rank'])
+
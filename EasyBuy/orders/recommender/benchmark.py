@@ -0,0 +1,193 @@
+"""
+Recommender benchmark on synthetic catalogs.
+
+Catalogs and interaction logs are generated in memory and fed straight into Recommender.fit,
+so any size can be measured without a database. Every run reports build wall time, peak RSS,
+artifact size and p50/p99 latencies of the serving calls as a JSON-serialisable dict.
+"""
+import os
+import platform
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import scipy
+import sklearn
+from scipy import sparse
+
+from .artifact import resolve_artifact
+from .index import DEFAULT_TOP_K
+from .pipeline import NeighborCandidates, RecommendationPipeline
+from .profiling import peak_rss_mb
+from .recommender import Recommender
+
+BENCHMARK_VERSION = 1
+
+
+def synthetic_catalog(n_products, n_users, interactions_per_user=20, n_categories=50, words_per_product=12,
+                      vocab_size=20000, random_state=0):
+    """
+    Random catalog with some structure: products of a category share topic words, and users buy
+    mostly inside one favourite category with Zipf-distributed product popularity.
+    Returns (product_ids, texts, user_ids, interactions) as expected by Recommender.fit.
+    """
+    rng = np.random.default_rng(random_state)
+    n_categories = max(1, min(n_categories, n_products))
+    categories = np.arange(n_products) % n_categories
+
+    # half of each text comes from its category's topic words, half from the whole vocabulary
+    topic_size = max(1, vocab_size // n_categories)
+    n_topic = words_per_product // 2
+    topic_words = categories[:, None] * topic_size + rng.integers(0, topic_size, (n_products, n_topic))
+    other_words = rng.zipf(1.3, (n_products, words_per_product - n_topic)) % vocab_size
+    words = np.hstack([topic_words, other_words])
+    texts = [' '.join('w%d' % w for w in row) for row in words.tolist()]
+
+    # category members are categories c, c + n_categories, ...; low ranks are the popular ones
+    per_user = rng.poisson(interactions_per_user, n_users) + 1
+    users = np.repeat(np.arange(n_users), per_user)
+    favourite = rng.integers(0, n_categories, n_users)[users]
+    in_category = rng.random(len(users)) < 0.7
+    rank = rng.zipf(1.2, len(users)) - 1
+    category = np.where(in_category, favourite, rng.integers(0, n_categories, len(users)))
+    per_category = -(-n_products // n_categories)
+    products = category + (rank % per_category) * n_categories
+    products = np.where(products < n_products, products, category)
+    quantities = rng.integers(1, 4, len(users)).astype(np.float32)
+
+    interactions = sparse.csr_matrix((quantities, (users, products)), shape=(n_users, n_products))
+    interactions.sum_duplicates()
+    return np.arange(1, n_products + 1), texts, np.arange(1, n_users + 1), interactions
+
+
+def _directory_size(path):
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+
+def _latency(func, args_list):
+    timings = []
+    for args in args_list:
+        start = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - start)
+    timings = np.array(timings) * 1000
+    return {
+        'p50_ms': float(np.percentile(timings, 50)),
+        'p99_ms': float(np.percentile(timings, 99)),
+        'mean_ms': float(timings.mean()),
+        'requests': len(timings),
+    }
+
+
+def _hold_out(interactions, users, rng):
+    """Remove one random interaction of each of the given users. Returns (training matrix, held-out positions)."""
+    interactions = interactions.tolil(copy=True)
+    held_out = []
+    for u in users.tolist():
+        positions = interactions.rows[u]
+        held_out.append(positions[rng.integers(len(positions))] if positions else -1)
+        if positions:
+            interactions[u, held_out[-1]] = 0
+    return interactions.tocsr(), np.array(held_out)
+
+
+def run_benchmark(n_products, n_users=None, interactions_per_user=20, n_requests=1000, top_k=DEFAULT_TOP_K,
+                  top_n=10, block_size=None, workers=1, content_ann=False, backend='itemknn', quantize=False,
+                  random_state=0):
+    """
+    Generate a catalog of n_products (and n_users users, by default as many as products), build,
+    save and reload the model, then time get_similar_items, recommend_from_seeds (scores the whole
+    catalog) and the candidate pipeline with its in-memory neighbors generator (the co-purchase and
+    category generators need a database). recommend_for_user adds its seed and candidate queries
+    and the Product fetch on top of the pipeline.
+    One interaction of every sampled user is held out of training; hit_rate / pipeline_hit_rate
+    are the shares of those that recommend_from_seeds / the pipeline put in the user's top_n.
+    """
+    n_users = n_users or n_products
+    start = time.perf_counter()
+    product_ids, texts, user_ids, interactions = synthetic_catalog(
+        n_products, n_users, interactions_per_user=interactions_per_user, random_state=random_state)
+    generate_s = time.perf_counter() - start
+
+    rng = np.random.default_rng(random_state)
+    sample_products = rng.choice(product_ids, size=n_requests)
+    sample_users = rng.choice(n_users, size=min(n_requests, n_users), replace=False)
+    interactions, held_out = _hold_out(interactions, sample_users, rng)
+    seeds = [product_ids[interactions[u].indices] for u in sample_users.tolist()]
+
+    start = time.perf_counter()
+    model = Recommender.fit(product_ids, texts, user_ids, interactions, top_k=top_k, block_size=block_size,
+                            workers=workers, content_ann=content_ann, backend=backend, quantize=quantize)
+    build_s = time.perf_counter() - start
+    quantization = model.build_report.get('quantization')
+    del texts
+
+    with tempfile.TemporaryDirectory() as path:
+        start = time.perf_counter()
+        model.save(path)
+        save_s = time.perf_counter() - start
+        artifact_bytes = _directory_size(resolve_artifact(path))
+        del model
+
+        start = time.perf_counter()
+        model = Recommender.load(path)
+        load_s = time.perf_counter() - start
+
+        similar = _latency(model.get_similar_items, [(pid, top_n) for pid in sample_products.tolist()])
+        recommend = _latency(model.recommend_from_seeds, [(s, top_n) for s in seeds])
+        hits = [product_ids[pos] in model.recommend_from_seeds(s, top_n) for s, pos in zip(seeds, held_out) if pos >= 0]
+        pipeline = RecommendationPipeline([NeighborCandidates()])
+        ranked = _latency(lambda s, n: pipeline.recommend(model, s, n), [(s, top_n) for s in seeds])
+        pipeline_hits = [product_ids[pos] in pipeline.recommend(model, s, top_n)
+                         for s, pos in zip(seeds, held_out) if pos >= 0]
+        index_bytes = model.index.nbytes
+        factors_bytes = model.item_factors.nbytes if model.item_factors is not None else 0
+        del model
+
+    return {
+        'config': {
+            'n_products': n_products,
+            'n_users': n_users,
+            'interactions_per_user': interactions_per_user,
+            'top_k': top_k,
+            'top_n': top_n,
+            'block_size': block_size,
+            'workers': workers,
+            'content_ann': content_ann,
+            'backend': backend,
+            'quantize': quantize,
+            'random_state': random_state,
+        },
+        'n_interactions': int(interactions.nnz),
+        'generate_s': generate_s,
+        'build_s': build_s,
+        'save_s': save_s,
+        'load_s': load_s,
+        # process-wide peak, so run one size per process for exact figures;
+        # with workers != 1 the pool processes are not included
+        'peak_rss_mb': peak_rss_mb(),
+        'artifact_mb': artifact_bytes / 2 ** 20,
+        'index_mb': index_bytes / 2 ** 20,
+        'item_factors_mb': factors_bytes / 2 ** 20,
+        'hit_rate': float(np.mean(hits)) if hits else None,
+        'get_similar_items': similar,
+        'recommend_from_seeds': recommend,
+        'pipeline': ranked,
+        'pipeline_hit_rate': float(np.mean(pipeline_hits)) if pipeline_hits else None,
+        # ranking agreement with the float32 index, quantized runs only
+        'quantization': quantization,
+    }
+
+
+def environment():
+    return {
+        'benchmark_version': BENCHMARK_VERSION,
+        'started_at': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'numpy': np.__version__,
+        'scipy': scipy.__version__,
+        'sklearn': sklearn.__version__,
+    }
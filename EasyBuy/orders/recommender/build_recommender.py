@@ -1,6 +1,7 @@
 from django.core.management.base import BaseCommand
-from recommender import Recommender, MODEL_PATH
-import os
+from .recommender import Recommender, MODEL_PATH, DEFAULT_TOP_K, BACKENDS
+from .profiling import StageProfiler
+from . import als
 
 class Command(BaseCommand):
     help = "Build or rebuild the product recommender model"
@@ -8,12 +9,56 @@ class Command(BaseCommand):
     def add_arguments(self, parser):
         parser.add_argument('--content-weight', type=float, default=0.5)
         parser.add_argument('--collab-weight', type=float, default=0.5)
+        parser.add_argument('--top-k', type=int, default=DEFAULT_TOP_K,
+                            help="Number of neighbors kept per product")
+        parser.add_argument('--workers', type=int, default=1,
+                            help="Processes used for the similarity step (-1 = all cores)")
+        parser.add_argument('--block-size', type=int, default=None,
+                            help="Rows of the similarity matrix scored per task (default: sized to the catalog)")
+        parser.add_argument('--content-ann', action='store_true',
+                            help="Use approximate (LSH) content neighbors instead of exact all-pairs cosine")
+        parser.add_argument('--ann-tables', type=int, default=16,
+                            help="LSH hash tables, more tables = higher recall and slower build")
+        parser.add_argument('--ann-bucket-size', type=int, default=1024,
+                            help="Target products per LSH bucket, larger = higher recall and slower build")
+        parser.add_argument('--backend', choices=BACKENDS, default='itemknn',
+                            help="Collaborative similarity from raw interactions (itemknn) or ALS factors (als)")
+        parser.add_argument('--factors', type=int, default=als.FACTORS,
+                            help="ALS latent factors per user/product")
+        parser.add_argument('--als-iterations', type=int, default=als.ITERATIONS)
+        parser.add_argument('--quantize', action='store_true',
+                            help="Store neighbor scores as uint8 with a per-product scale (4x smaller index)")
         parser.add_argument('--path', type=str, default=MODEL_PATH)
+        parser.add_argument('--profile-json', type=str, default=None,
+                            help="Also write the per-stage time/memory/query report to this JSON file")
 
     def handle(self, *args, **options):
         content_w = options['content_weight']
         collab_w = options['collab_weight']
-        print("Building recommender (content_w=%s collab_w=%s)..." % (content_w, collab_w))
-        model = Recommender.build(content_weight=content_w, collab_weight=collab_w)
-        model.save(path=options['path'])
-        print("Saved recommender to", options['path'])
\ No newline at end of file
+        top_k = options['top_k']
+        print("Building recommender (backend=%s content_w=%s collab_w=%s top_k=%s workers=%s)..."
+              % (options['backend'], content_w, collab_w, top_k, options['workers']))
+        profiler = StageProfiler()
+        model = Recommender.build(content_weight=content_w, collab_weight=collab_w, top_k=top_k,
+                                  block_size=options['block_size'], workers=options['workers'],
+                                  content_ann=options['content_ann'], ann_tables=options['ann_tables'],
+                                  ann_bucket_size=options['ann_bucket_size'], backend=options['backend'],
+                                  factors=options['factors'], als_iterations=options['als_iterations'],
+                                  quantize=options['quantize'], profiler=profiler)
+        if 'content_ann' in model.build_report:
+            report = model.build_report['content_ann']
+            print("Content ANN recall@%s vs exact: %.3f (%s sampled products)"
+                  % (report['k'], report['recall_at_k'], report['sample_size']))
+        if 'quantization' in model.build_report:
+            report = model.build_report['quantization']
+            print("Quantized index: %.1fMB -> %.1fMB, top-%s overlap vs float32: %.3f, max score error %.4f"
+                  % (report['full_mb'], report['quantized_mb'], report['top_n'], report['overlap_at_n'],
+                     report['max_abs_error']))
+        with profiler.stage('save') as stage:
+            model.save(path=options['path'])
+            stage['rows'] = len(model.index)
+        print("Saved recommender version", model.model_version, "to", options['path'])
+        print(profiler.table())
+        if options['profile_json']:
+            profiler.write_json(options['profile_json'], command='build_recommender',
+                                model_version=model.model_version)
\ No newline at end of file
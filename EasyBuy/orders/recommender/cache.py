@@ -0,0 +1,149 @@
+"""
+Per-user recommendation result cache.
+
+Entries are keyed by user, model build version and request parameters. Invalidation never deletes
+entries: it replaces a generation token that is part of every key, so stale entries simply
+become unreachable and age out. Generation tokens are unique (time based), so even a token
+evicted from the cache can never bring back an old entry.
+
+Configured with the RECOMMENDER_CACHE setting, e.g.
+    RECOMMENDER_CACHE = {'BACKEND': 'django', 'ALIAS': 'default', 'TTL': 300}
+'lru' (the default) keeps entries in process memory, which is fastest but only invalidated in the
+process that saw the purchase; use 'django' with a shared cache when running several workers.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+DEFAULT_TTL = 300
+DEFAULT_MAX_SIZE = 10000
+
+
+class LRUCache:
+    """Thread-safe in-process LRU cache with a per-entry time to live."""
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE, ttl=DEFAULT_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            value, expires = item
+            if expires is not None and expires < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def get_many(self, keys):
+        missing = object()
+        values = {key: self.get(key, missing) for key in keys}
+        return {key: value for key, value in values.items() if value is not missing}
+
+    def set(self, key, value, timeout=None):
+        """timeout: seconds, None for the cache TTL, 0 to keep until evicted"""
+        ttl = self.ttl if timeout is None else timeout
+        expires = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class DjangoCache:
+    """Adapter over a cache from Django's cache framework (Redis, memcached, ...)."""
+
+    def __init__(self, alias='default', ttl=DEFAULT_TTL):
+        from django.core.cache import caches
+        self._cache = caches[alias]
+        self.ttl = ttl
+
+    def get(self, key, default=None):
+        return self._cache.get(key, default)
+
+    def get_many(self, keys):
+        return self._cache.get_many(keys)
+
+    def set(self, key, value, timeout=None):
+        ttl = self.ttl if timeout is None else timeout
+        # Django uses None for "never expires"
+        self._cache.set(key, value, ttl or None)
+
+    def clear(self):
+        self._cache.clear()
+
+
+class RecommendationCache:
+    GLOBAL_KEY = 'recs:gen'
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def _user_key(self, user_id):
+        return 'recs:gen:%s' % user_id
+
+    @staticmethod
+    def _new_generation():
+        return '%x' % time.time_ns()
+
+    def _generations(self, user_id):
+        keys = [self.GLOBAL_KEY, self._user_key(user_id)]
+        found = self.backend.get_many(keys)
+        generations = []
+        for key in keys:
+            gen = found.get(key)
+            if gen is None:
+                gen = self._new_generation()
+                self.backend.set(key, gen, timeout=0)
+            generations.append(gen)
+        return generations
+
+    def key(self, user_id, model_version, *params):
+        global_gen, user_gen = self._generations(user_id)
+        return 'recs:%s:%s:%s:%s:%s' % (global_gen, user_gen, model_version, user_id,
+                                        ':'.join(str(p) for p in params))
+
+    def get(self, user_id, model_version, *params):
+        return self.backend.get(self.key(user_id, model_version, *params))
+
+    def set(self, user_id, model_version, value, *params):
+        self.backend.set(self.key(user_id, model_version, *params), value)
+
+    def invalidate_user(self, user_id):
+        """Drop a user's cached results, e.g. after they complete an order or write a review."""
+        self.backend.set(self._user_key(user_id), self._new_generation(), timeout=0)
+
+    def invalidate_all(self):
+        """Drop every cached result, e.g. after a new model was trained."""
+        self.backend.set(self.GLOBAL_KEY, self._new_generation(), timeout=0)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """The process-wide RecommendationCache, built from settings.RECOMMENDER_CACHE on first use."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            options = getattr(settings, 'RECOMMENDER_CACHE', {})
+            ttl = options.get('TTL', DEFAULT_TTL)
+            if options.get('BACKEND', 'lru') == 'django':
+                backend = DjangoCache(alias=options.get('ALIAS', 'default'), ttl=ttl)
+            else:
+                backend = LRUCache(max_size=options.get('MAX_SIZE', DEFAULT_MAX_SIZE), ttl=ttl)
+            _cache = RecommendationCache(backend)
+        return _cache
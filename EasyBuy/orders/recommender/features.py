@@ -0,0 +1,134 @@
+"""
+Content feature store for the recommender.
+
+A product's text (name, description, tags, review text, category) becomes hashed unigram and
+bigram counts through a stateless HashingVectorizer, so every product is vectorized on its own,
+without refitting a vocabulary over the catalog. The counts are stored per product in
+ProductFeatures next to a hash of the text they came from and of the vectorizer settings: a build
+only re-vectorizes products whose text changed (every product, after the settings change), and
+reviews or product edits queue their product for a refresh by the `update_recommender` command
+(updates.py).
+
+TF-IDF weights are applied on top of the counts with document frequencies computed at build time
+and saved with the model, so rows folded into a served model later (incremental.update_products)
+are weighted like the rest.
+"""
+import hashlib
+
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.preprocessing import normalize
+
+from products.models import Product
+from orders.models import ProductFeatures
+from .interactions import CHUNK_SIZE
+
+N_FEATURES = 2 ** 18
+
+_vectorizer = HashingVectorizer(n_features=N_FEATURES, ngram_range=(1, 2), alternate_sign=False, norm=None,
+                                dtype=np.float32)
+# settings the stored counts depend on (n_features, ngram_range, alternate_sign, ...), part of every text hash
+VECTORIZER_TAG = repr(sorted(_vectorizer.get_params().items()))
+
+
+def product_text(product):
+    """Text the content features of a product (with prefetched tags and reviews) are computed from."""
+    tags = " ".join(t.caption for t in product.tags.all())
+    reviews = " ".join(r.review or "" for r in product.reviews.all())
+    return " ".join([product.name or "", product.description or "", tags, reviews, product.category or ""])
+
+
+def text_hash(text):
+    return hashlib.sha1((VECTORIZER_TAG + '\n' + text).encode('utf-8')).hexdigest()
+
+
+def vectorize(texts):
+    """(len(texts) x N_FEATURES) CSR matrix of hashed term counts."""
+    return _vectorizer.transform(texts)
+
+
+def document_frequencies(counts):
+    """Number of rows of a counts matrix each hashed term appears in."""
+    return np.bincount(counts.indices, minlength=counts.shape[1]).astype(np.int64)
+
+
+def tfidf(counts, df, n_documents):
+    """L2-normalised TF-IDF rows of hashed counts, with smoothed idf (as TfidfVectorizer) from stored frequencies."""
+    idf = (np.log((1 + n_documents) / (1 + np.asarray(df, dtype=np.float64))) + 1).astype(np.float32)
+    weighted = sparse.csr_matrix(counts, dtype=np.float32) @ sparse.diags(idf)
+    return normalize(weighted.tocsr()).astype(np.float32)
+
+
+def _rows_to_csr(rows, n_features=N_FEATURES):
+    """(indices, counts) rows as a CSR matrix; None rows are empty."""
+    rows = [row if row is not None else (np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32))
+            for row in rows]
+    indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+    np.cumsum([len(idx) for idx, _ in rows], out=indptr[1:])
+    indices = np.concatenate([idx for idx, _ in rows]) if rows else np.empty(0, dtype=np.int32)
+    data = np.concatenate([cnt for _, cnt in rows]) if rows else np.empty(0, dtype=np.float32)
+    return sparse.csr_matrix((data, indices, indptr), shape=(len(rows), n_features))
+
+
+def _stored_rows(product_ids=None, chunk_size=CHUNK_SIZE):
+    """{product_id: (text_hash, indices, counts)} of the stored rows, all of them by default."""
+    qs = ProductFeatures.objects.all()
+    if product_ids is not None:
+        qs = qs.filter(product_id__in=list(product_ids))
+    return {
+        pid: (digest, np.frombuffer(indices, dtype=np.int32), np.frombuffer(counts, dtype=np.float32))
+        for pid, digest, indices, counts in qs.values_list('product_id', 'text_hash', 'indices', 'counts')
+        .iterator(chunk_size=chunk_size)
+    }
+
+
+def stored_counts(product_ids):
+    """Stored counts of the given products as a CSR matrix in that order; products without a row are empty."""
+    stored = _stored_rows(product_ids)
+    return _rows_to_csr([stored[pid][1:] if pid in stored else None for pid in np.asarray(product_ids).tolist()])
+
+
+def sync_features(product_ids, texts, all_products=True, batch_size=1000):
+    """
+    Hashed term counts of the products (ids with their current texts) as a CSR matrix in that
+    order. Only products whose text differs from the one their stored row was computed from are
+    vectorized, and their rows are written back.
+    all_products: read every stored row in one pass instead of looking the ids up
+    Returns (counts, ids of the products that were vectorized).
+    """
+    product_ids = np.asarray(product_ids, dtype=np.int64)
+    stored = _stored_rows(None if all_products else product_ids)
+    hashes = [text_hash(text) for text in texts]
+    rows = [None] * len(product_ids)
+    changed = []
+    for i, (pid, digest) in enumerate(zip(product_ids.tolist(), hashes)):
+        row = stored.get(pid)
+        if row is not None and row[0] == digest:
+            rows[i] = row[1:]
+        else:
+            changed.append(i)
+
+    if changed:
+        fresh = vectorize([texts[i] for i in changed])
+        for j, i in enumerate(changed):
+            start, end = fresh.indptr[j], fresh.indptr[j + 1]
+            rows[i] = (fresh.indices[start:end].astype(np.int32), fresh.data[start:end].astype(np.float32))
+        ProductFeatures.objects.bulk_create(
+            [ProductFeatures(product_id=int(product_ids[i]), text_hash=hashes[i],
+                             indices=rows[i][0].tobytes(), counts=rows[i][1].tobytes()) for i in changed],
+            batch_size=batch_size, update_conflicts=True, unique_fields=['product'],
+            update_fields=['text_hash', 'indices', 'counts', 'updated_at'],
+        )
+    return _rows_to_csr(rows), product_ids[changed]
+
+
+def refresh_features(product_ids):
+    """Re-vectorize the given products if their text changed. Returns the ids of the refreshed ones."""
+    products = Product.objects.filter(id__in=list(product_ids)).prefetch_related('tags', 'reviews').order_by('id')
+    ids, texts = [], []
+    for product in products:
+        ids.append(product.id)
+        texts.append(product_text(product))
+    _, changed = sync_features(ids, texts, all_products=False)
+    return changed
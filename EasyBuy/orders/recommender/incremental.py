@@ -0,0 +1,204 @@
+"""
+Incremental recommender updates.
+
+When a user completes an order or writes a review, only that user's interaction row is
+re-read from the DB and only the neighbor rows of the products they touched are recomputed
+(for ALS models, after re-solving the factors of that user and those products).
+When a product's text changes, its content row is rebuilt from the feature store (features.py)
+and only its neighbor row is recomputed.
+The nightly full build stays the source of truth; this keeps fresh purchases visible in between.
+Changes are queued by the signal handlers (updates.py) and applied by the `update_recommender`
+management command, never inside a web worker.
+
+Costs and limits, which is why updates are batched and the full build still runs nightly:
+
+- Every update publishes a complete new artifact (publish_artifact writes and fsyncs every array),
+  and the content and interaction matrices are rebuilt with O(nnz) sparse products. Its cost grows
+  with the catalog and the interaction count, not with the number of changed rows, so
+  `update_recommender --interval` should be long enough for one write to cover many queued changes.
+- Only the rows of the affected products are recomputed. An unaffected product whose neighbor row
+  lists an affected one keeps the stale similarity to it, and one that should now list it does not,
+  so item-item similarity is briefly asymmetric until the next full build.
+"""
+import numpy as np
+from scipy import sparse
+
+from orders.models import RecommenderUpdate
+
+from .als import gram, item_arrays, solve_rows
+from .artifact import MODEL_PATH, ArtifactError, artifact_lock, publish_artifact, read_artifact
+from .cache import get_cache
+from .features import refresh_features, stored_counts, tfidf
+from .index import NeighborIndex, top_k_rows
+from .interactions import load_user_interactions
+from .similarity import similarity_rows
+from .updates import queue_updates, take_updates
+
+
+def sparse_to_arrays(name, matrix):
+    matrix = sparse.csr_matrix(matrix)
+    return {
+        name + '_data': matrix.data.astype(np.float32),
+        name + '_indices': matrix.indices.astype(np.int32),
+        name + '_indptr': matrix.indptr.astype(np.int64),
+    }
+
+
+def sparse_from_arrays(name, arrays, n_cols):
+    indptr = arrays[name + '_indptr']
+    return sparse.csr_matrix((arrays[name + '_data'], arrays[name + '_indices'], indptr),
+                             shape=(len(indptr) - 1, n_cols))
+
+
+def state_to_arrays(content, interactions, user_ids, user_factors=None, content_df=None):
+    """Arrays persisted next to the neighbor index so the model can be updated in place."""
+    arrays = {'user_ids': np.asarray(user_ids, dtype=np.int64)}
+    arrays.update(sparse_to_arrays('content', content))
+    arrays.update(sparse_to_arrays('interactions', interactions))
+    if user_factors is not None:
+        arrays['user_factors'] = user_factors
+    if content_df is not None:
+        arrays['content_df'] = np.asarray(content_df, dtype=np.int64)
+    return arrays
+
+
+def _selection(positions, n_rows):
+    """Sparse (n_rows x len(positions)) matrix that places row i of a matrix at positions[i]."""
+    return sparse.csr_matrix(
+        (np.ones(len(positions), dtype=np.float32), (positions, np.arange(len(positions)))),
+        shape=(n_rows, len(positions)),
+    )
+
+
+def _update_factors(arrays, config, user_ids, all_user_ids, changed_pos, interactions, affected):
+    """ALS models: re-solve the factors of the changed users, then of the items they touch(ed)."""
+    alpha, regularization = config['alpha'], config['regularization']
+    items = np.array(arrays['item_factors'])
+    users = np.zeros((len(all_user_ids), items.shape[1]), dtype=np.float32)
+    users[np.searchsorted(all_user_ids, user_ids)] = arrays['user_factors']
+    users[changed_pos] = solve_rows(alpha * interactions[changed_pos], items, gram(items, regularization),
+                                    users[changed_pos])
+    items[affected] = solve_rows(alpha * interactions.T.tocsr()[affected], users, gram(users, regularization),
+                                 items[affected])
+    return users, items
+
+
+def update_users(store_user_ids, path=MODEL_PATH):
+    """
+    Refresh the interactions of the given users in the saved model and recompute the
+    neighbor rows of every product they interact(ed) with (not the rows of the products
+    listing those, see above). Rewrites the whole artifact. Returns the number of rows updated.
+    """
+    with artifact_lock(path):
+        arrays, manifest = read_artifact(path)
+        if 'user_ids' not in arrays:
+            raise ArtifactError("Artifact at %s has no training state, rebuild it first" % path)
+        # the published version keeps the build version of the artifact it updates
+        meta = dict(manifest['meta'], build_version=manifest['meta'].get('build_version', manifest['model_version']))
+        config = meta['config']
+        index = NeighborIndex.from_arrays(arrays)
+        content = sparse_from_arrays('content', arrays, meta['content_features'])
+        interactions = sparse_from_arrays('interactions', arrays, len(index))
+        user_ids = arrays['user_ids']
+
+        changed = np.unique(np.asarray(store_user_ids, dtype=np.int64))
+        all_user_ids = np.union1d(user_ids, changed)
+        changed_pos = np.searchsorted(all_user_ids, changed)
+
+        # widen the matrix to the new user list, then swap in the fresh rows of the changed users
+        old = (_selection(np.searchsorted(all_user_ids, user_ids), len(all_user_ids)) @ interactions).tocsr()
+        fresh = load_user_interactions(changed, index.product_ids)
+        keep = np.ones(len(all_user_ids), dtype=np.float32)
+        keep[changed_pos] = 0
+        updated = (sparse.diags(keep) @ old + _selection(changed_pos, len(all_user_ids)) @ fresh).tocsr()
+        updated.eliminate_zeros()
+
+        affected = np.union1d(old[changed_pos].indices, fresh.indices)
+        user_factors = None
+        collab = updated.T.tocsr()
+        if 'item_factors' in arrays:
+            user_factors, collab = _update_factors(arrays, config, user_ids, all_user_ids, changed_pos,
+                                                   updated, affected)
+        if len(affected):
+            block = similarity_rows(affected, content, collab, config['content_weight'], config['collab_weight'])
+            index = index.replace_rows(affected, top_k_rows(block, config['top_k'], positions=affected))
+
+        new_arrays = index.to_arrays()
+        if user_factors is not None:
+            new_arrays.update(item_arrays(collab, config['regularization']))
+        new_arrays.update(state_to_arrays(content, updated, all_user_ids, user_factors, arrays.get('content_df')))
+        publish_artifact(path, new_arrays, meta=meta)
+    return len(affected)
+
+
+def update_products(product_ids, path=MODEL_PATH):
+    """
+    Fold the stored content features of the given products into the saved model, weighted with
+    the document frequencies of the last build, and recompute their neighbor rows.
+    Products the model doesn't know yet are left to the next build. Rewrites the whole artifact.
+    Returns the number of rows updated.
+    """
+    with artifact_lock(path):
+        arrays, manifest = read_artifact(path)
+        if 'content_df' not in arrays:
+            raise ArtifactError("Artifact at %s has no content feature state, rebuild it first" % path)
+        # the published version keeps the build version of the artifact it updates
+        meta = dict(manifest['meta'], build_version=manifest['meta'].get('build_version', manifest['model_version']))
+        config = meta['config']
+        index = NeighborIndex.from_arrays(arrays)
+        positions = index.positions_of(np.unique(np.asarray(product_ids, dtype=np.int64)))
+        if not len(positions):
+            return 0
+        content = sparse_from_arrays('content', arrays, meta['content_features'])
+        fresh = tfidf(stored_counts(index.product_ids[positions]), arrays['content_df'], content.shape[0])
+        keep = np.ones(len(index), dtype=np.float32)
+        keep[positions] = 0
+        content = (sparse.diags(keep) @ content + _selection(positions, len(index)) @ fresh).tocsr()
+        content.eliminate_zeros()
+
+        if 'item_factors' in arrays:
+            collab = arrays['item_factors']
+        else:
+            interactions = sparse_from_arrays('interactions', arrays, len(index))
+            # content-only until anything is bought or reviewed, as in Recommender.fit
+            collab = interactions.T.tocsr() if interactions.nnz else None
+        block = similarity_rows(positions, content, collab, config['content_weight'], config['collab_weight'])
+        index = index.replace_rows(positions, top_k_rows(block, config['top_k'], positions=positions))
+
+        new_arrays = dict(arrays)
+        new_arrays.update(index.to_arrays())
+        new_arrays.update(sparse_to_arrays('content', content))
+        publish_artifact(path, new_arrays, meta=meta)
+    return len(positions)
+
+
+def process_updates(path=MODEL_PATH):
+    """
+    Apply everything queued in updates.py: refresh the stored features of the queued products
+    (only those whose text changed are re-vectorized) and fold them into the model, then refresh
+    the queued users. Ids are re-queued if an update fails.
+    Returns {'users': n, 'products': n re-vectorized, 'rows': neighbor rows updated}.
+    """
+    pending = take_updates()
+    users, products = pending[RecommenderUpdate.USER], pending[RecommenderUpdate.PRODUCT]
+    result = {'users': len(users), 'products': 0, 'rows': 0}
+    try:
+        if products:
+            # products whose text did not change (e.g. stock updates) are skipped by the text hash
+            changed = refresh_features(products)
+            result['products'] = len(changed)
+            if len(changed):
+                result['rows'] += update_products(changed, path=path)
+        if users:
+            result['rows'] += update_users(users, path=path)
+            # entries cached from the previous rows of these users (shared cache backends)
+            for user_id in users:
+                get_cache().invalidate_user(user_id)
+    except FileNotFoundError:
+        # no model built yet, the stored features and the users are picked up by the next build
+        pass
+    except Exception:
+        queue_updates(RecommenderUpdate.USER, users)
+        queue_updates(RecommenderUpdate.PRODUCT, products)
+        raise
+    return result
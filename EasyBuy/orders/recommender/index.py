@@ -0,0 +1,312 @@
+import numpy as np
+
+DEFAULT_TOP_K = 50
+
+
+def top_k_rows(block, k, row_offset=0, positions=None):
+    """
+    Select the k highest positive scores of every row of a similarity block.
+
+    block: 2D array (rows x n_items), or a sparse CSR matrix of which only the stored entries
+           are ranked; rows are items row_offset .. row_offset + len(block), or the items at
+           positions when given
+    Returns a list of (indices, scores) tuples, one per row, sorted by descending score.
+    The item itself (the diagonal) is never returned as its own neighbor.
+    """
+    n_rows, n_cols = block.shape
+    rows = np.arange(n_rows)
+    diag = rows + row_offset if positions is None else np.asarray(positions, dtype=np.int64)
+    if hasattr(block, 'indptr'):
+        return _top_k_csr_rows(block, k, diag)
+    block = np.array(block, dtype=np.float32, copy=True)
+    inside = diag < n_cols
+    block[rows[inside], diag[inside]] = -np.inf
+
+    k = min(k, n_cols - 1)
+    if k <= 0 or n_rows == 0:
+        empty = (np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32))
+        return [empty] * n_rows
+
+    part = np.argpartition(-block, k - 1, axis=1)[:, :k]
+    part_scores = np.take_along_axis(block, part, axis=1)
+    order = np.argsort(-part_scores, axis=1, kind='stable')
+    top_idx = np.take_along_axis(part, order, axis=1).astype(np.int32)
+    top_scores = np.take_along_axis(part_scores, order, axis=1)
+
+    result = []
+    for r in range(n_rows):
+        keep = top_scores[r] > 0
+        result.append((top_idx[r][keep], top_scores[r][keep]))
+    return result
+
+
+def _top_k_csr_rows(block, k, diag):
+    """top_k_rows of a CSR block, ranking all rows together with one lexsort (as top_n_per_row)."""
+    block.sum_duplicates()
+    n_rows = block.shape[0]
+    rows = np.repeat(np.arange(n_rows), np.diff(block.indptr))
+    indices = block.indices.astype(np.int32)
+    data = block.data.astype(np.float32)
+    keep = (data > 0) & (indices != diag[rows])
+    rows, indices, data = rows[keep], indices[keep], data[keep]
+    order = np.lexsort((-data, rows))
+    rows, indices, data = rows[order], indices[order], data[order]
+    keep = np.arange(len(rows)) - np.searchsorted(rows, rows, side='left') < k
+    rows, indices, data = rows[keep], indices[keep], data[keep]
+    bounds = np.searchsorted(rows, np.arange(1, n_rows))
+    return list(zip(np.split(indices, bounds), np.split(data, bounds)))
+
+
+def top_n_positions(scores, top_n):
+    """
+    Return the positions of the top_n highest positive scores, best first.
+    Uses a partial sort (argpartition) so the cost is O(n_items + top_n log top_n).
+    """
+    candidates = np.flatnonzero(scores > 0)
+    if top_n <= 0 or len(candidates) == 0:
+        return np.empty(0, dtype=np.int64)
+    if len(candidates) > top_n:
+        part = np.argpartition(-scores[candidates], top_n - 1)[:top_n]
+        candidates = candidates[part]
+    order = np.argsort(-scores[candidates], kind='stable')
+    return candidates[order]
+
+
+def top_n_per_row(indptr, indices, data, top_n):
+    """
+    Top_n positive entries of every row of a CSR matrix given by its arrays, best first.
+    All rows are ranked together with one lexsort. Returns a list of position arrays, one per row.
+    """
+    n_rows = len(indptr) - 1
+    rows = np.repeat(np.arange(n_rows), np.diff(indptr))
+    keep = data > 0
+    rows, indices, data = rows[keep], indices[keep], data[keep]
+    order = np.lexsort((-data, rows))
+    rows, indices = rows[order], indices[order]
+    rank = np.arange(len(rows)) - np.searchsorted(rows, rows, side='left')
+    keep = rank < top_n
+    rows, indices = rows[keep], indices[keep]
+    return np.split(indices, np.searchsorted(rows, np.arange(1, n_rows)))
+
+
+def _quantize(indptr, scores):
+    """(scales, uint8 scores) of CSR rows of positive scores, scaled so every row's max maps to 255."""
+    lengths = np.diff(indptr)
+    row_max = np.zeros(len(lengths), dtype=np.float32)
+    nonempty = lengths > 0
+    row_max[nonempty] = np.maximum.reduceat(scores, indptr[:-1][nonempty]) if len(scores) else 0
+    scales = row_max / 255
+    divisor = np.repeat(np.where(scales > 0, scales, 1), lengths)
+    return scales, np.clip(np.rint(scores / divisor), 0, 255).astype(np.uint8)
+
+
+class NeighborIndex:
+    """
+    Top-K item-item neighbors stored in CSR layout.
+
+    product_ids: int64 array, position -> product.id, sorted ascending
+    indptr: int64 array of length n_items + 1, row i spans indptr[i]:indptr[i + 1]
+    indices: int32 array of neighbor positions
+    scores: float32 array of neighbor scores, descending within each row
+    scales: None, or for quantized indexes (see quantize) a float32 array with one scale per row;
+            scores are then uint8 and the score of an entry of row i is scores * scales[i]
+    """
+
+    def __init__(self, product_ids, indptr, indices, scores, scales=None):
+        self.product_ids = np.asarray(product_ids, dtype=np.int64)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int32)
+        self.scores = np.asarray(scores, dtype=np.float32 if scales is None else np.uint8)
+        self.scales = None if scales is None else np.asarray(scales, dtype=np.float32)
+        if len(self.product_ids) > 1 and not np.all(self.product_ids[1:] > self.product_ids[:-1]):
+            raise ValueError("product_ids must be sorted and unique")
+
+    ARRAYS = ('product_ids', 'indptr', 'indices', 'scores')
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        return cls(*(arrays[name] for name in cls.ARRAYS), scales=arrays.get('scales'))
+
+    def to_arrays(self):
+        arrays = {name: getattr(self, name) for name in self.ARRAYS}
+        if self.quantized:
+            arrays['scales'] = self.scales
+        return arrays
+
+    @property
+    def quantized(self):
+        return self.scales is not None
+
+    def quantize(self):
+        """
+        Return a copy storing every score as a uint8 fraction of its row's best score,
+        4x smaller than float32. Rows keep their order; relative error is at most 1/510 of the row max.
+        """
+        if self.quantized:
+            return self
+        scales, scores = _quantize(self.indptr, self.scores)
+        return type(self)(self.product_ids, self.indptr, self.indices, scores, scales=scales)
+
+    def float_scores(self):
+        """Scores of all entries as float32, in storage order."""
+        if not self.quantized:
+            return self.scores
+        return self.scores * np.repeat(self.scales, np.diff(self.indptr))
+
+    @classmethod
+    def from_rows(cls, product_ids, rows):
+        """
+        rows: list of (indices, scores) per item, in product_ids order
+        """
+        lengths = np.fromiter((len(idx) for idx, _ in rows), dtype=np.int64, count=len(rows))
+        indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=indptr[1:])
+        if rows:
+            indices = np.concatenate([idx for idx, _ in rows]).astype(np.int32)
+            scores = np.concatenate([sc for _, sc in rows]).astype(np.float32)
+        else:
+            indices = np.empty(0, dtype=np.int32)
+            scores = np.empty(0, dtype=np.float32)
+        return cls(product_ids, indptr, indices, scores)
+
+    @classmethod
+    def from_blocks(cls, product_ids, blocks, k=DEFAULT_TOP_K):
+        """
+        Build the index from an iterable of (row_offset, dense_block) similarity blocks
+        covering all items in order, so the full N x N matrix never exists at once.
+        """
+        rows = []
+        for row_offset, block in blocks:
+            rows.extend(top_k_rows(block, k, row_offset=row_offset))
+        return cls.from_rows(product_ids, rows)
+
+    def __len__(self):
+        return len(self.product_ids)
+
+    @property
+    def nbytes(self):
+        return (self.product_ids.nbytes + self.indptr.nbytes + self.indices.nbytes + self.scores.nbytes
+                + (self.scales.nbytes if self.quantized else 0))
+
+    def replace_rows(self, positions, rows):
+        """
+        Return a new index where the rows at positions are replaced by rows
+        (a list of (indices, scores) tuples). Unchanged rows are copied in one vectorized pass.
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        lengths = np.diff(self.indptr)
+        new_lengths = lengths.copy()
+        new_lengths[positions] = [len(idx) for idx, _ in rows]
+        indptr = np.zeros(len(self) + 1, dtype=np.int64)
+        np.cumsum(new_lengths, out=indptr[1:])
+
+        unchanged = np.ones(len(self), dtype=bool)
+        unchanged[positions] = False
+        indices = np.empty(indptr[-1], dtype=np.int32)
+        scores = np.empty(indptr[-1], dtype=self.scores.dtype)
+        scales = None if not self.quantized else np.array(self.scales)
+        dst = np.repeat(unchanged, new_lengths)
+        src = np.repeat(unchanged, lengths)
+        indices[dst] = self.indices[src]
+        scores[dst] = self.scores[src]
+        for pos, (idx, sc) in zip(positions.tolist(), rows):
+            if scales is not None:
+                row_scale, sc = _quantize(np.array([0, len(sc)]), np.asarray(sc, dtype=np.float32))
+                scales[pos] = row_scale[0]
+            indices[indptr[pos]:indptr[pos + 1]] = idx
+            scores[indptr[pos]:indptr[pos + 1]] = sc
+        return type(self)(self.product_ids, indptr, indices, scores, scales=scales)
+
+    def positions_of(self, product_ids):
+        """Map product ids to positions with a binary search; unknown ids are dropped."""
+        ids = np.asarray(product_ids, dtype=np.int64)
+        if len(self) == 0 or len(ids) == 0:
+            return np.empty(0, dtype=np.int64)
+        pos = np.searchsorted(self.product_ids, ids)
+        pos = np.minimum(pos, len(self) - 1)
+        return pos[self.product_ids[pos] == ids]
+
+    def position_of(self, product_id):
+        pos = self.positions_of([product_id])
+        return int(pos[0]) if len(pos) else None
+
+    def row(self, position):
+        """Return (neighbor_positions, scores) for the item at the given position."""
+        start, end = self.indptr[position], self.indptr[position + 1]
+        if self.quantized:
+            return self.indices[start:end], self.scores[start:end] * self.scales[position]
+        return self.indices[start:end], self.scores[start:end]
+
+    def _seed_entries(self, seed_positions, weights=None):
+        """(neighbor positions, scores) of every stored entry of the seed rows, concatenated."""
+        seed_positions = np.asarray(seed_positions, dtype=np.int64)
+        starts = self.indptr[seed_positions]
+        lengths = self.indptr[seed_positions + 1] - starts
+        total = int(lengths.sum())
+        # flat positions of every stored entry of the seed rows
+        offsets = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+        flat = np.arange(total, dtype=np.int64) + offsets
+        values = self.scores[flat]
+        if self.quantized:
+            # one scale per seed row, folded into the weights
+            weights = self.scales[seed_positions] * (1 if weights is None else np.asarray(weights, dtype=np.float32))
+        if weights is not None:
+            values = values * np.repeat(np.asarray(weights, dtype=np.float32), lengths)
+        return self.indices[flat], values
+
+    def score_seeds(self, seed_positions, weights=None):
+        """
+        Sum the neighbor rows of the seed items into one dense score vector over all items.
+        Equivalent to a sparse vector x matrix product, done with a single bincount.
+        """
+        indices, values = self._seed_entries(seed_positions, weights)
+        if not len(indices):
+            return np.zeros(len(self), dtype=np.float32)
+        scores = np.bincount(indices, weights=values, minlength=len(self))
+        return scores.astype(np.float32)
+
+    def seed_neighbors(self, seed_positions, weights=None):
+        """
+        Sparse version of score_seeds: (sorted positions, summed scores) of only the items the
+        seed rows reach, so the cost is O(seeds x K) whatever the catalog size.
+        """
+        indices, values = self._seed_entries(seed_positions, weights)
+        positions, inverse = np.unique(indices, return_inverse=True)
+        scores = np.bincount(inverse, weights=values, minlength=len(positions))
+        return positions.astype(np.int64), scores.astype(np.float32)
+
+    def neighbors(self, product_id, top_n=10):
+        """Return up to top_n (product_id, score) pairs most similar to product_id."""
+        pos = self.position_of(product_id)
+        if pos is None:
+            return []
+        idx, scores = self.row(pos)
+        idx, scores = idx[:top_n], scores[:top_n]
+        return list(zip(self.product_ids[idx].tolist(), scores.tolist()))
+
+
+def ranking_agreement(full, quantized, top_n=10, seeds_per_user=5, sample_size=200, random_state=0):
+    """
+    How closely a quantized index ranks like the full-precision one: for sample_size random
+    seed sets of seeds_per_user products, the mean overlap of the top_n recommendations
+    (1.0 = identical lists) and the largest absolute score error.
+    """
+    rng = np.random.default_rng(random_state)
+    n_items = len(full)
+    overlaps, errors = [], [0.0]
+    for _ in range(sample_size if n_items else 0):
+        seeds = rng.choice(n_items, size=min(seeds_per_user, n_items), replace=False)
+        exact, approx = full.score_seeds(seeds), quantized.score_seeds(seeds)
+        exact[seeds] = approx[seeds] = 0
+        expected = top_n_positions(exact, top_n)
+        if len(expected):
+            overlaps.append(len(np.intersect1d(expected, top_n_positions(approx, top_n))) / len(expected))
+        errors.append(float(np.abs(exact - approx).max()))
+    return {
+        'top_n': top_n,
+        'sample_size': len(overlaps),
+        'overlap_at_n': float(np.mean(overlaps)) if overlaps else 1.0,
+        'max_abs_error': max(errors),
+        'full_mb': full.nbytes / 2 ** 20,
+        'quantized_mb': quantized.nbytes / 2 ** 20,
+    }
@@ -0,0 +1,80 @@
+from itertools import islice
+
+import numpy as np
+from scipy import sparse
+
+from products.models import Review
+from orders.models import OrderItem
+
+# rows fetched per round trip when streaming interactions out of the DB
+CHUNK_SIZE = 10000
+
+
+def _lookup(sorted_ids, ids):
+    """Positions of ids inside sorted_ids, plus a mask of which ids were found."""
+    if len(sorted_ids) == 0:
+        return np.zeros(len(ids), dtype=np.int64), np.zeros(len(ids), dtype=bool)
+    pos = np.minimum(np.searchsorted(sorted_ids, ids), len(sorted_ids) - 1)
+    return pos, sorted_ids[pos] == ids
+
+
+def interaction_matrix(rows, user_ids, product_ids):
+    """
+    Turn (user_id, product_id, value) rows into a len(user_ids) x len(product_ids) CSR matrix.
+    Duplicate (user, product) pairs are summed; rows for unknown users or products are dropped.
+    user_ids and product_ids must be sorted.
+    """
+    data = np.asarray(rows, dtype=np.int64).reshape(-1, 3)
+    users, user_found = _lookup(user_ids, data[:, 0])
+    products, product_found = _lookup(product_ids, data[:, 1])
+    keep = user_found & product_found
+    matrix = sparse.coo_matrix(
+        (data[keep, 2].astype(np.float32), (users[keep], products[keep])),
+        shape=(len(user_ids), len(product_ids)),
+    )
+    return matrix.tocsr()
+
+
+def _interaction_querysets(store_user_ids=None):
+    """(user_id, product_id, value) rows: quantities bought in completed orders and review ratings."""
+    purchases = OrderItem.objects.filter(order__status='COMPLETED', product__isnull=False)
+    ratings = Review.objects.all()
+    if store_user_ids is not None:
+        purchases = purchases.filter(order__store_user_id__in=store_user_ids)
+        ratings = ratings.filter(reviewer_id__in=store_user_ids)
+    return [
+        purchases.values_list('order__store_user_id', 'product_id', 'quantity'),
+        ratings.values_list('reviewer_id', 'product_id', 'rating'),
+    ]
+
+
+def _stream_rows(queryset, chunk_size):
+    """Yield the rows of a values_list queryset as (n x 3) int64 arrays, chunk_size rows at a time."""
+    rows = queryset.iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield np.array(chunk, dtype=np.int64)
+
+
+def load_interactions(product_ids, chunk_size=CHUNK_SIZE):
+    """
+    Stream every interaction into a sparse users x products matrix, without building model
+    instances or a dense pivot. Returns (user_ids, csr_matrix); memory scales with the
+    number of interactions, not users x products.
+    """
+    chunks = [chunk for qs in _interaction_querysets() for chunk in _stream_rows(qs, chunk_size)]
+    data = np.concatenate(chunks) if chunks else np.empty((0, 3), dtype=np.int64)
+    user_ids = np.unique(data[:, 0])
+    return user_ids, interaction_matrix(data, user_ids, product_ids)
+
+
+def load_user_interactions(store_user_ids, product_ids):
+    """
+    Interaction rows of the given users as a len(store_user_ids) x len(product_ids) CSR matrix.
+    Both id arrays must be sorted.
+    """
+    store_user_ids = np.asarray(store_user_ids, dtype=np.int64)
+    rows = [row for qs in _interaction_querysets(store_user_ids.tolist()) for row in qs]
+    return interaction_matrix(rows, store_user_ids, product_ids)
@@ -0,0 +1,228 @@
+"""
+Two-stage recommendations: candidate generation, then ranking.
+
+Scoring the seeds against the whole catalog grows with the catalog. Here every candidate
+generator contributes at most `limit` products from one cheap source:
+
+    neighbors     items the seeds' neighbor rows reach, by summed similarity (in memory, O(seeds x K))
+    co_purchase   consequents of the seeds' mined co-purchase rules (baskets.py), by confidence (one query)
+    category      most popular in-stock products of the seeds' categories (one query)
+
+and the ranker scores only the union of those candidates: a weighted sum of the model score
+(summed similarity, or the folded-in ALS dot product) and the score every generator gave, each
+relative to its best candidate. Seeds and out-of-stock products are dropped before the top-N
+selection. A new signal is one more generator and one more weight.
+
+Carts use a neighbors-only pipeline (get_cart_pipeline): "you may also need" suggestions are
+served from the in-memory index alone, without queries.
+
+Generators run in order under a per-request latency budget (RECOMMENDER_LATENCY_BUDGET_MS).
+Every generator's duration is tracked as a moving average; one that is not expected to finish
+within what is left of the budget is skipped, as is one that fails, and ranking runs on what
+was gathered. The first generator always runs. The estimate of a skipped generator decays, so
+it is retried once it may be fast again.
+"""
+import logging
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Max, Q
+
+from products.models import Product
+from orders.models import ProductAssociation, ProductPopularity
+from .index import top_n_positions
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUDGET_MS = 50.0
+# candidates per generator
+CANDIDATES = 200
+# ranking weights by feature; 'model' is the model score, the others are generator names
+WEIGHTS = {'model': 1.0, 'co_purchase': 0.5, 'category': 0.1}
+# weight of the latest run in a generator's moving average duration
+COST_SMOOTHING = 0.2
+
+
+def _relative(scores):
+    top = scores.max() if len(scores) else 0
+    return scores / top if top > 0 else scores
+
+
+def _to_positions(index, product_ids, scores):
+    """Index positions of (product id, score) rows; products the model doesn't know are dropped."""
+    ids = np.asarray(product_ids, dtype=np.int64)
+    scores = np.asarray(scores, dtype=np.float32)
+    if len(index) == 0 or len(ids) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    pos = np.minimum(np.searchsorted(index.product_ids, ids), len(index) - 1)
+    found = index.product_ids[pos] == ids
+    return pos[found], scores[found]
+
+
+class NeighborCandidates:
+    name = 'neighbors'
+
+    def __init__(self, limit=CANDIDATES):
+        self.limit = limit
+
+    def __call__(self, model, seed_ids, seed_positions):
+        positions, scores = model.seed_neighbors(seed_positions)
+        top = top_n_positions(scores, self.limit)
+        return positions[top], scores[top]
+
+
+class CoPurchaseCandidates:
+    name = 'co_purchase'
+
+    def __init__(self, limit=CANDIDATES):
+        self.limit = limit
+
+    def __call__(self, model, seed_ids, seed_positions):
+        # pair rules of any seed, triple rules whose two antecedents are both seeds
+        rows = list(ProductAssociation.objects
+                    .filter(Q(antecedent_id__in=seed_ids),
+                            Q(with_product__isnull=True) | Q(with_product_id__in=seed_ids))
+                    .values('consequent_id').annotate(confidence=Max('confidence'))
+                    .order_by('-confidence').values_list('consequent_id', 'confidence')[:self.limit])
+        ids, confidence = zip(*rows) if rows else ((), ())
+        return _to_positions(model.index, ids, confidence)
+
+
+class CategoryCandidates:
+    name = 'category'
+
+    def __init__(self, limit=CANDIDATES):
+        self.limit = limit
+
+    def __call__(self, model, seed_ids, seed_positions):
+        categories = Product.objects.filter(id__in=seed_ids).values('category')
+        rows = list(ProductPopularity.objects.filter(category__in=categories, product__quantity__gt=0)
+                    .values_list('product_id', 'score')[:self.limit])
+        ids, scores = zip(*rows) if rows else ((), ())
+        positions, scores = _to_positions(model.index, ids, scores)
+        return positions, _relative(scores)
+
+
+class RecommendationPipeline:
+    def __init__(self, generators=None, weights=None, budget_ms=LATENCY_BUDGET_MS):
+        """
+        generators: callables (model, seed_ids, seed_positions) -> (index positions, scores) with a
+                    `name`, run in this order; defaults to neighbors, co_purchase, category
+        weights: ranking weights by feature name, merged over WEIGHTS; features without one are
+                 used as candidates only
+        """
+        self.generators = list(generators) if generators is not None else [
+            NeighborCandidates(), CoPurchaseCandidates(), CategoryCandidates()]
+        self.weights = dict(WEIGHTS, **(weights or {}))
+        self.budget_ms = budget_ms
+        # generator name -> moving average duration in ms
+        self._costs = {}
+        self._lock = threading.Lock()
+
+    def recommend(self, model, seed_ids, top_n=10, exclude_seeds=True, available=None, trace=None):
+        """
+        Ids of the top_n products to recommend for the seed products of a user or cart.
+        exclude_seeds: drop the seeds themselves, otherwise they keep a tenth of their score
+        available: optional boolean mask over index positions (see ServingModel.available)
+        trace: optional dict, filled with the duration and output size of every stage, the
+               names of the skipped generators and the total duration
+        """
+        seed_ids = [int(pid) for pid in seed_ids]
+        trace = {} if trace is None else trace
+        trace.update(stages=[], skipped=[])
+        if not seed_ids:
+            return []
+        start = time.perf_counter()
+        seed_positions = model.index.positions_of(seed_ids)
+
+        candidates = []
+        for i, generator in enumerate(self.generators):
+            left = self.budget_ms - (time.perf_counter() - start) * 1000
+            if i and self._costs.get(generator.name, 0.0) > left:
+                self._skip(generator.name, trace)
+                continue
+            began = time.perf_counter()
+            try:
+                positions, scores = generator(model, seed_ids, seed_positions)
+            except Exception:
+                logger.exception("Candidate generator %s failed, ranking without it", generator.name)
+                self._skip(generator.name, trace)
+                continue
+            elapsed = (time.perf_counter() - began) * 1000
+            self._record(generator.name, elapsed)
+            trace['stages'].append({'stage': generator.name, 'ms': elapsed, 'candidates': len(positions)})
+            candidates.append((generator.name, positions, scores))
+
+        began = time.perf_counter()
+        top = self.rank(model, seed_positions, candidates, top_n, exclude_seeds, available)
+        trace['stages'].append({'stage': 'rank', 'ms': (time.perf_counter() - began) * 1000, 'results': len(top)})
+        trace['ms'] = (time.perf_counter() - start) * 1000
+        return model.index.product_ids[top].tolist()
+
+    def rank(self, model, seed_positions, candidates, top_n, exclude_seeds=True, available=None):
+        """Index positions of the top_n of the (name, positions, scores) candidates, best first."""
+        positions = np.unique(np.concatenate([p for _, p, _ in candidates] or [np.empty(0, dtype=np.int64)]))
+        if not len(positions):
+            return positions
+        score = self.weights.get('model', 0) * _relative(model.score_candidates(seed_positions, positions))
+        for name, feature_positions, feature_scores in candidates:
+            weight = self.weights.get(name, 0)
+            if weight and len(feature_positions):
+                feature = np.zeros(len(positions), dtype=np.float32)
+                feature[np.searchsorted(positions, feature_positions)] = feature_scores
+                score += weight * _relative(feature)
+
+        seeds = np.minimum(np.searchsorted(positions, seed_positions), len(positions) - 1)
+        seeds = seeds[positions[seeds] == seed_positions]
+        score[seeds] = 0 if exclude_seeds else score[seeds] * 0.1
+        if available is not None:
+            score[~available[positions]] = 0
+        return positions[top_n_positions(score, top_n)]
+
+    def _record(self, name, elapsed):
+        with self._lock:
+            cost = self._costs.get(name)
+            self._costs[name] = elapsed if cost is None else cost + COST_SMOOTHING * (elapsed - cost)
+
+    def _skip(self, name, trace):
+        trace['skipped'].append(name)
+        with self._lock:
+            if name in self._costs:
+                self._costs[name] *= 1 - COST_SMOOTHING
+
+
+_pipeline = None
+_cart_pipeline = None
+_pipeline_lock = threading.Lock()
+
+
+def get_pipeline():
+    """
+    Process-wide RecommendationPipeline, configured from RECOMMENDER_LATENCY_BUDGET_MS,
+    RECOMMENDER_CANDIDATES (per generator) and RECOMMENDER_RANKING_WEIGHTS.
+    """
+    global _pipeline
+    with _pipeline_lock:
+        if _pipeline is None:
+            limit = getattr(settings, 'RECOMMENDER_CANDIDATES', CANDIDATES)
+            _pipeline = RecommendationPipeline(
+                generators=[NeighborCandidates(limit), CoPurchaseCandidates(limit), CategoryCandidates(limit)],
+                weights=getattr(settings, 'RECOMMENDER_RANKING_WEIGHTS', None),
+                budget_ms=getattr(settings, 'RECOMMENDER_LATENCY_BUDGET_MS', LATENCY_BUDGET_MS),
+            )
+        return _pipeline
+
+
+def get_cart_pipeline():
+    """
+    Process-wide neighbors-only RecommendationPipeline for carts, ranking by the model score
+    alone; RECOMMENDER_CANDIDATES applies.
+    """
+    global _cart_pipeline
+    with _pipeline_lock:
+        if _cart_pipeline is None:
+            limit = getattr(settings, 'RECOMMENDER_CANDIDATES', CANDIDATES)
+            _cart_pipeline = RecommendationPipeline(generators=[NeighborCandidates(limit)])
+        return _cart_pipeline
@@ -0,0 +1,117 @@
+"""
+Time-decayed product popularity for cold-start recommendations.
+
+Every purchased unit adds 2 ** ((ordered_at - epoch) / half_life) to its product's score
+("forward decay"). The decayed value at any time `now` is score * 2 ** (-(now - epoch) / half_life),
+a factor shared by all products, so ranking by the raw score is ranking by decayed popularity
+and a new order is a single increment.
+
+The weights grow without bound, and overflow a float ~1024 half-lives after the epoch (~19 years
+with the default 7 day half-life, under 3 years with a 1 day one). So the epoch is stored in the
+PopularityEpoch row and every `refresh_popularity` rescores the table relative to the refresh time;
+running it periodically (e.g. daily, see the management command) keeps the weights small.
+Tables scored before the epoch was stored are relative to EPOCH.
+
+Rankings are read from the ProductPopularity table and cached for
+RECOMMENDER_POPULARITY_TTL seconds, so a cold-start request costs one cache lookup.
+"""
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+from products.models import Product
+from orders.models import OrderItem, PopularityEpoch, ProductPopularity
+from .cache import get_cache
+
+EPOCH = datetime(2025, 1, 1, tzinfo=timezone.utc)
+HALF_LIFE_DAYS = 7.0
+CACHE_TTL = 60
+
+
+def current_epoch():
+    """The time the stored scores are relative to."""
+    row = PopularityEpoch.objects.first()
+    return row.epoch if row else EPOCH
+
+
+def decay_weight(when, epoch=EPOCH):
+    half_life = getattr(settings, 'RECOMMENDER_POPULARITY_HALF_LIFE_DAYS', HALF_LIFE_DAYS) * 86400
+    return 2 ** ((when - epoch).total_seconds() / half_life)
+
+
+def decayed_score(score, now=None):
+    """A stored score as a decayed purchase count at `now`, for display; rankings can use the raw score."""
+    return score / decay_weight(now or datetime.now(timezone.utc), current_epoch())
+
+
+def _scores(rows, epoch):
+    """(product_id, category, quantity, ordered_at) rows -> {product_id: (category, score)}"""
+    scores = defaultdict(float)
+    categories = {}
+    for product_id, category, quantity, ordered_at in rows:
+        scores[product_id] += quantity * decay_weight(ordered_at, epoch)
+        categories[product_id] = category
+    return {pid: (categories[pid], score) for pid, score in scores.items()}
+
+
+def record_purchases(rows):
+    """
+    Add completed purchases, given as (product_id, category, quantity, ordered_at) rows,
+    to the popularity table: one insert for new products plus one increment per product.
+    """
+    if not rows:
+        return
+    with transaction.atomic():
+        scores = _scores(rows, current_epoch())
+        ProductPopularity.objects.bulk_create(
+            [ProductPopularity(product_id=pid, category=category) for pid, (category, _) in scores.items()],
+            ignore_conflicts=True,
+        )
+        for pid, (category, score) in scores.items():
+            ProductPopularity.objects.filter(product_id=pid).update(score=F('score') + score, category=category)
+
+
+def refresh_popularity(batch_size=1000, now=None):
+    """
+    Recompute the whole popularity table from completed orders, relative to `now` as the new epoch.
+    Returns the number of products scored.
+    """
+    epoch = now or datetime.now(timezone.utc)
+    rows = (OrderItem.objects.filter(order__status='COMPLETED', product__isnull=False)
+            .values_list('product_id', 'product__category', 'quantity', 'order__ordered_at')
+            .iterator(chunk_size=10000))
+    scores = _scores(rows, epoch)
+    with transaction.atomic():
+        PopularityEpoch.objects.update_or_create(pk=1, defaults={'epoch': epoch})
+        ProductPopularity.objects.all().delete()
+        ProductPopularity.objects.bulk_create(
+            [ProductPopularity(product_id=pid, category=category, score=score)
+             for pid, (category, score) in scores.items()],
+            batch_size=batch_size,
+        )
+    return len(scores)
+
+
+def popular_products(category=None, limit=10):
+    """
+    The `limit` most popular in-stock products right now, overall or within a Product.category.
+    Falls back to the newest products while nothing has been bought yet.
+    """
+    cache = get_cache().backend
+    key = 'recs:popular:%s:%s' % (category or '', limit)
+    products = cache.get(key)
+    if products is None:
+        qs = ProductPopularity.objects.select_related('product').filter(product__quantity__gt=0)
+        if category:
+            qs = qs.filter(category=category)
+        products = [row.product for row in qs[:limit]]
+        if not products:
+            fallback = Product.objects.filter(quantity__gt=0).order_by('-id')
+            if category:
+                fallback = fallback.filter(category=category)
+            products = list(fallback[:limit])
+        cache.set(key, products, timeout=getattr(settings, 'RECOMMENDER_POPULARITY_TTL', CACHE_TTL))
+    return products
@@ -0,0 +1,92 @@
+"""
+Per-stage resource report for model builds.
+
+    profiler = StageProfiler()
+    with profiler.stage('load products') as stage:
+        rows = list(queryset)
+        stage['rows'] = len(rows)
+    print(profiler.table())
+
+Each stage records wall and CPU time, how much it raised the process's peak RSS, the rows it
+handled (when the caller sets them) and the DB queries it ran. CPU time and RSS only cover
+this process, not joblib worker processes.
+"""
+import json
+import sys
+import time
+from contextlib import contextmanager
+
+from django.db import connection
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, None where it cannot be measured."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+class StageProfiler:
+    COLUMNS = (('stage', 'stage', '%s'), ('wall_s', 'wall s', '%.3f'), ('cpu_s', 'cpu s', '%.3f'),
+               ('peak_rss_delta_mb', 'peak rss +MB', '%.1f'), ('rows', 'rows', '%d'), ('queries', 'queries', '%d'))
+
+    def __init__(self):
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name):
+        """Time the block; it may set record['rows'] on the yielded record."""
+        record = {'stage': name, 'rows': None}
+        queries = 0
+
+        def count_queries(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        rss = peak_rss_mb()
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            with connection.execute_wrapper(count_queries):
+                yield record
+        finally:
+            record.update(
+                wall_s=time.perf_counter() - wall,
+                cpu_s=time.process_time() - cpu,
+                peak_rss_delta_mb=None if rss is None else peak_rss_mb() - rss,
+                queries=queries,
+            )
+            self.stages.append(record)
+
+    def totals(self):
+        return {
+            'stage': 'total',
+            'wall_s': sum(s['wall_s'] for s in self.stages),
+            'cpu_s': sum(s['cpu_s'] for s in self.stages),
+            'peak_rss_mb': peak_rss_mb(),
+            'queries': sum(s['queries'] for s in self.stages),
+        }
+
+    def table(self):
+        """The stages as a plain-text table, with a total row."""
+        totals = dict(self.totals(), peak_rss_delta_mb=None, rows=None)
+        lines = [[title for _, title, _ in self.COLUMNS]]
+        for record in self.stages + [totals]:
+            lines.append(['-' if record.get(key) is None else fmt % record[key] for key, _, fmt in self.COLUMNS])
+        widths = [max(len(line[i]) for line in lines) for i in range(len(self.COLUMNS))]
+        return "\n".join(
+            "  ".join(cell.ljust(w) if i == 0 else cell.rjust(w) for i, (cell, w) in enumerate(zip(line, widths)))
+            for line in lines
+        )
+
+    def write_json(self, path, **extra):
+        with open(path, 'w') as f:
+            json.dump(dict(extra, stages=self.stages, total=self.totals()), f, indent=2)
+            f.write('\n')
@@ -1,211 +1,259 @@
-import os
-import pickle
-from collections import defaultdict
-
+import numpy as np
 import pandas as pd
-from django.db.models import Prefetch
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+from scipy import sparse
+
+from products.models import Product
+from .index import NeighborIndex, DEFAULT_TOP_K, ranking_agreement, top_n_per_row, top_n_positions
+from . import als, features
+from .artifact import MODEL_PATH, artifact_lock, new_version, publish_artifact
+from .ann import lsh_neighbors, recall_report
+from .incremental import state_to_arrays
+from .interactions import CHUNK_SIZE, load_interactions, load_user_interactions
+from .profiling import StageProfiler
+from .serving import ServingModel
+from .similarity import auto_block_size, top_k_neighbors
+
+BACKENDS = ('itemknn', 'als')
 
-from products.models import Product, Review
-from orders.models import OrderItem, Order
-from core.models import StoreUser
 
-MODEL_PATH = os.path.join('models', 'recommender.pkl') 
+class Recommender(ServingModel):
+    """
+    Training side of the recommender: builds, saves and incrementally refreshes artifacts and
+    scores users in batches. Request-time scoring is inherited from ServingModel (serving.py).
+    """
 
-class Recommender:
-    def __init__(self, item_sim=None, product_index=None, products_df=None, config=None):
+    def __init__(self, index=None, products_df=None, config=None, model_version=None, state=None,
+                 build_report=None, item_factors=None, item_gram=None, build_version=None):
         """
-        item_sim: pandas.DataFrame with item-item similarities (indexed by product.id)
-        product_index: map product.id -> integer index used in similarity matrix
-        products_df: DataFrame of product info (id, name, category, tags, etc)
-        config: dict with hyperparams (weights)
+        products_df: DataFrame of product info (id, name, category), only available right after build
+        state: dict with the content / interaction matrices needed for incremental updates,
+               only available right after build
+        build_report: dict of quality/size figures collected while building, saved in the manifest
+        Other arguments as for ServingModel.
         """
-        self.item_sim = item_sim
-        self.product_index = product_index or {}
+        super().__init__(index=index, config=config, model_version=model_version,
+                         item_factors=item_factors, item_gram=item_gram, build_version=build_version)
         self.products_df = products_df
-        self.config = config or {'content_weight': 0.5, 'collab_weight': 0.5}
+        self.state = state
+        self.build_report = build_report or {}
+        # (index, its item_similarity matrix)
+        self._item_similarity = None
 
     @classmethod
-    def build(cls, content_weight=0.5, collab_weight=0.5):
+    def build(cls, content_weight=0.5, collab_weight=0.5, top_k=DEFAULT_TOP_K, block_size=None,
+              workers=1, chunk_size=CHUNK_SIZE, content_ann=False, ann_tables=16, ann_bucket_size=1024,
+              backend='itemknn', factors=als.FACTORS, als_iterations=als.ITERATIONS, quantize=False,
+              profiler=None):
         """
-        Build the recommender from DB.
+        Build the recommender from DB (the DB is only read here, the model itself is built by fit).
+        Only the top_k neighbors of each product are kept, so the model is O(N * top_k).
+        Similarities are computed block_size rows at a time on `workers` processes.
+        With content_ann, content similarity comes from an LSH index (ann.py) instead of
+        exact all-pairs cosine, and its recall against exact search is put in build_report.
+        backend: 'itemknn' compares items by their raw interaction vectors, 'als' factorizes the
+                 interactions (als.py) and compares items by their `factors`-dimensional factors.
+        quantize: store neighbor scores as uint8 with one scale per product (NeighborIndex.quantize);
+                  how far rankings move from full precision is put in build_report.
+        profiler: StageProfiler recording every stage (profiling.py); its stages are put in build_report
         """
-        # 1) Load products and build text features
-        qs = Product.objects.prefetch_related('tags', 'reviews', 'seller')
-        products = []
-        for p in qs:
-            tags = " ".join([t.caption for t in p.tags.all()])
-            reviews_text = " ".join([r.review or "" for r in p.reviews.all()])
-            combined = " ".join([p.name or "", p.description or "", tags, reviews_text, p.category or ""])
-            products.append({
-                'id': p.id,
-                'name': p.name,
-                'category': p.category,
-                'text': combined,
-            })
-        products_df = pd.DataFrame(products)
+        profiler = profiler or StageProfiler()
+        # 1) Load products and their text features
+        # ordered by id so the neighbor index can look products up with a binary search
+        with profiler.stage('load products') as stage:
+            qs = list(Product.objects.prefetch_related('tags', 'reviews').order_by('id'))
+            stage['rows'] = len(qs)
+        with profiler.stage('assemble text') as stage:
+            products = []
+            texts = []
+            for p in qs:
+                products.append({
+                    'id': p.id,
+                    'name': p.name,
+                    'category': p.category,
+                })
+                texts.append(features.product_text(p))
+            del qs
+            products_df = pd.DataFrame(products)
+            stage['rows'] = len(texts)
         if products_df.empty:
             raise ValueError("No products found in DB")
+        # only products whose text changed since the last build are vectorized again
+        with profiler.stage('vectorize changed text') as stage:
+            content_counts, vectorized = features.sync_features(products_df['id'].to_numpy(), texts)
+            stage['rows'] = len(vectorized)
+        del texts
 
-        # map product id -> index
-        product_index = {pid: idx for idx, pid in enumerate(products_df['id'].tolist())}
-
-        # 2) Content similarity: TF-IDF on combined text
-        tfidf = TfidfVectorizer(max_features=5000, ngram_range=(1,2))
-        X_text = tfidf.fit_transform(products_df['text'].fillna(''))
-        content_sim = cosine_similarity(X_text)
-        content_sim_df = pd.DataFrame(content_sim, index=products_df['id'], columns=products_df['id'])
-
-        # 3) Collaborative similarity from orders/reviews
-        # Build user-item interaction matrix. Use rating if exists, else 1 for purchase.
-        # Get OrderItems joined with Orders (only completed orders maybe)
-        orderitems = OrderItem.objects.select_related('order', 'product')
-        # We'll include only completed orders for stronger signal
-        orderitems = orderitems.filter(order__status='COMPLETED')
-
-        rows = []
-        for oi in orderitems:
-            rows.append({
-                'user_id': oi.order.store_user.id,
-                'product_id': oi.product.id if oi.product else None,
-                'quantity': oi.quantity,
-            })
-        orders_df = pd.DataFrame(rows)
-        if orders_df.empty:
-            # fallback to reviews if no completed orders
-            reviews = Review.objects.select_related('reviewer', 'product')
-            rows = [{'user_id': r.reviewer.id, 'product_id': r.product.id, 'rating': r.rating} for r in reviews]
-            orders_df = pd.DataFrame(rows)
-        # Combine with reviews (explicit ratings) to enrich the matrix
-        reviews = Review.objects.select_related('reviewer', 'product')
-        rev_rows = []
-        for r in reviews:
-            rev_rows.append({'user_id': r.reviewer.id, 'product_id': r.product.id, 'rating': r.rating})
-        reviews_df = pd.DataFrame(rev_rows)
-
-        # pivot: user x product
-        if not orders_df.empty:
-            # convert quantity -> implicit interest score
-            orders_df['score'] = orders_df['quantity'].fillna(1).astype(float)
-            # keep max if multiple purchases
-            purchases = orders_df.groupby(['user_id', 'product_id'])['score'].sum().reset_index()
-            pivot = purchases.pivot_table(index='user_id', columns='product_id', values='score', fill_value=0)
-        else:
-            pivot = pd.DataFrame()
-
-        if not reviews_df.empty:
-            if pivot.empty:
-                pivot = reviews_df.pivot_table(index='user_id', columns='product_id', values='rating', fill_value=0)
-            else:
-                # merge reviews into pivot (additive)
-                reviews_piv = reviews_df.pivot_table(index='user_id', columns='product_id', values='rating', fill_value=0)
-                pivot = pivot.add(reviews_piv, fill_value=0)
-
-        if pivot.empty:
-            # no collaborative data; use content-only
-            collab_sim_df = pd.DataFrame(0, index=products_df['id'], columns=products_df['id'])
-        else:
-            # item vectors are columns of pivot; compute item-item cosine similarity
-            # ensure columns correspond to product ids in product_index
-            pivot = pivot.fillna(0)
-            # reorder columns to match products_df ids (if missing, fill zeros)
-            cols = products_df['id'].tolist()
-            pivot = pivot.reindex(columns=cols, fill_value=0)
-            item_matrix = pivot.T.values  # shape (n_items, n_users)
-            collab_sim = cosine_similarity(item_matrix)
-            collab_sim_df = pd.DataFrame(collab_sim, index=cols, columns=cols)
-
-        # 4) Combine sims
+        # 2) Collaborative signal from orders/reviews
+        # user x product matrix of purchased quantities (completed orders) plus review ratings,
+        # streamed from the DB straight into sparse form
+        with profiler.stage('load interactions') as stage:
+            user_ids, interactions = load_interactions(products_df['id'].to_numpy(), chunk_size=chunk_size)
+            stage['rows'] = interactions.nnz
+
+        model = cls.fit(products_df['id'].to_numpy(), None, user_ids, interactions, content_counts=content_counts,
+                        products_df=products_df, content_weight=content_weight,
+                        collab_weight=collab_weight, top_k=top_k, block_size=block_size, workers=workers,
+                        content_ann=content_ann, ann_tables=ann_tables, ann_bucket_size=ann_bucket_size,
+                        backend=backend, factors=factors, als_iterations=als_iterations, quantize=quantize,
+                        profiler=profiler)
+        model.build_report['content_features'] = {'products': len(products_df), 'vectorized': len(vectorized)}
+        return model
+
+    @classmethod
+    def fit(cls, product_ids, texts, user_ids, interactions, products_df=None, content_weight=0.5,
+            collab_weight=0.5, top_k=DEFAULT_TOP_K, block_size=None, workers=1, content_ann=False,
+            ann_tables=16, ann_bucket_size=1024, backend='itemknn', factors=als.FACTORS,
+            als_iterations=als.ITERATIONS, quantize=False, content_counts=None, profiler=None):
+        """
+        Build the recommender from in-memory data, without touching the DB.
+
+        product_ids: sorted product ids
+        texts: product text (name, description, tags, reviews, ...) in product_ids order
+        user_ids: sorted user ids, the rows of interactions
+        interactions: (n_users x n_products) sparse matrix of purchase quantities / ratings
+        content_counts: hashed term counts of the products (features.py), used instead of texts
+        profiler: StageProfiler recording every stage, a new one by default
+        """
+        profiler = profiler or StageProfiler()
+        # Content features: TF-IDF of hashed term counts, with document frequencies kept for later updates
+        with profiler.stage('tf-idf') as stage:
+            if content_counts is None:
+                content_counts = features.vectorize(texts)
+            content_df = features.document_frequencies(content_counts)
+            X_text = features.tfidf(content_counts, content_df, content_counts.shape[0])
+            stage['rows'] = X_text.shape[0]
+        build_report = {}
+        content_neighbors = None
+        if content_ann:
+            with profiler.stage('content ann') as stage:
+                content_neighbors = lsh_neighbors(X_text, top_k, n_tables=ann_tables, bucket_size=ann_bucket_size)
+                build_report['content_ann'] = recall_report(X_text, content_neighbors, top_k)
+                stage['rows'] = content_neighbors.nnz
+
+        if backend not in BACKENDS:
+            raise ValueError("Unknown backend %r, expected one of %s" % (backend, ', '.join(BACKENDS)))
         cw = content_weight
         rw = collab_weight
-        combined_sim = cw * content_sim_df + rw * collab_sim_df
-        # optionally normalize rows
-        # convert to DataFrame indexed by product.id
-        combined_sim_df = combined_sim
+        config = {'content_weight': cw, 'collab_weight': rw, 'top_k': top_k, 'backend': backend}
 
-        model = cls(item_sim=combined_sim_df, product_index=product_index, products_df=products_df,
-                    config={'content_weight': cw, 'collab_weight': rw})
+        # item vectors are the columns of the interaction matrix, shape (n_items, n_users),
+        # or their ALS factors, shape (n_items, factors)
+        interactions = sparse.csr_matrix(interactions, dtype=np.float32)
+        item_matrix = interactions.T.tocsr() if interactions.nnz else None
+        user_factors = item_factors = None
+        if backend == 'als' and interactions.nnz:
+            config.update(factors=factors, regularization=als.REGULARIZATION, alpha=als.ALPHA,
+                          iterations=als_iterations)
+            with profiler.stage('als') as stage:
+                user_factors, item_factors = als.implicit_als(interactions, factors=factors,
+                                                              iterations=als_iterations)
+                stage['rows'] = interactions.nnz
+            item_matrix = item_factors
+
+        # Combine sims block by block and keep only the top-K neighbors of each product
+        with profiler.stage('similarity + top-k') as stage:
+            rows = top_k_neighbors(X_text, item_matrix, cw, rw, top_k, block_size=block_size, workers=workers,
+                                   content_neighbors=content_neighbors)
+            stage['rows'] = len(rows)
+        with profiler.stage('combine index') as stage:
+            index = NeighborIndex.from_rows(np.asarray(product_ids), rows)
+            del rows
+            stage['rows'] = len(index.indices)
+        if quantize:
+            with profiler.stage('quantize') as stage:
+                config['quantized'] = True
+                full, index = index, index.quantize()
+                build_report['quantization'] = ranking_agreement(full, index)
+                stage['rows'] = len(index.indices)
+        build_report['stages'] = list(profiler.stages)
+
+        model = cls(index=index, products_df=products_df, config=config,
+                    state={'content': X_text, 'interactions': interactions, 'user_ids': user_ids,
+                           'user_factors': user_factors, 'content_df': content_df},
+                    build_report=build_report)
+        if item_factors is not None:
+            model.item_factors = item_factors
+            model.item_gram = als.gram(item_factors, als.REGULARIZATION)
         return model
 
     def save(self, path=MODEL_PATH):
-        os.makedirs(os.path.dirname(path), exist_ok=True)
-        with open(path, 'wb') as f:
-            pickle.dump({
-                'item_sim': self.item_sim,
-                'product_index': self.product_index,
-                'products_df': self.products_df,
-                'config': self.config
-            }, f)
-
-    @classmethod
-    def load(cls, path=MODEL_PATH):
-        with open(path, 'rb') as f:
-            data = pickle.load(f)
-        return cls(item_sim=data['item_sim'],
-                   product_index=data['product_index'],
-                   products_df=data['products_df'],
-                   config=data.get('config', {}))
-
-    def get_similar_items(self, product_id, top_n=10):
-        if product_id not in self.item_sim.index:
-            return []
-        scores = self.item_sim.loc[product_id].sort_values(ascending=False)
-        # drop self
-        scores = scores.drop(labels=[product_id], errors='ignore')
-        top = scores.head(top_n).index.tolist()
-        return top
+        arrays = self.index.to_arrays()
+        if self.item_factors is not None:
+            arrays.update(item_factors=self.item_factors, item_gram=self.item_gram)
+        # incremental updates republish under new model versions but keep the build version
+        meta = {'config': self.config, 'build_report': self.build_report, 'build_version': new_version()}
+        if self.state is not None:
+            # keep what incremental.update_users needs to refresh single rows later
+            arrays.update(state_to_arrays(**self.state))
+            meta['content_features'] = self.state['content'].shape[1]
+        with artifact_lock(path):
+            manifest = publish_artifact(path, arrays, meta=meta)
+        self.model_version = manifest['model_version']
+        self.build_version = meta['build_version']
+        return manifest
 
-    def recommend_for_user(self, store_user_id, top_n=10, purchased_penalty=True):
+    def recommend_for_users(self, store_user_ids, top_n=10, purchased_penalty=True, chunk_size=1000):
         """
-        For a user: take items they purchased/have high rating for, aggregate similarity scores.
+        Batch version of recommend_from_seeds for many users at once, each user's purchased and
+        reviewed products being the seeds. Every user is scored against the whole catalog by the
+        model alone, without the candidate pipeline and its extra signals (co-purchase rules,
+        category popularity), so results can differ from recommend_for_user.
+
+        Seeds of chunk_size users are loaded with one query per source, then scored together
+        as a sparse (users x items) x (items x items) product (ALS models: a fold-in and a dense
+        product with the item factors). Returns {store_user_id: [product_id, ...]};
+        users without any purchase or review map to an empty list so callers can apply their own
+        cold-start fallback.
         """
-        # get user's purchased items and review ratings
-        # we prefer DB calls here to stay up-to-date
-        try:
-            su = StoreUser.objects.get(id=store_user_id)
-        except StoreUser.DoesNotExist:
-            return []
-
-        # purchases
-        orderitems = OrderItem.objects.select_related('order', 'product').filter(order__store_user=su, order__status='COMPLETED')
-        purchased_ids = [oi.product.id for oi in orderitems if oi.product]
-        # reviews
-        reviews = Review.objects.filter(reviewer=su).select_related('product')
-        rated_ids = [r.product.id for r in reviews if r.product]
-
-        seed_items = list(set(purchased_ids + rated_ids))
-        if not seed_items:
-            # cold start: recommend top popular or by category fallback
-            return self._cold_start_recommend(top_n)
-
-        # aggregate similarity scores
-        scores = defaultdict(float)
-        for pid in seed_items:
-            if pid not in self.item_sim.index:
-                continue
-            sim_series = self.item_sim.loc[pid]
-            for other_pid, sim_score in sim_series.items():
-                scores[other_pid] += sim_score
-
-        # remove already purchased
-        for pid in set(seed_items):
-            if purchased_penalty:
-                scores.pop(pid, None)
+        results = {}
+        for chunk in self.iter_recommendations(store_user_ids, top_n, purchased_penalty, chunk_size):
+            results.update(chunk)
+        return results
+
+    def iter_recommendations(self, store_user_ids, top_n=10, purchased_penalty=True, chunk_size=1000):
+        """recommend_for_users one chunk of users at a time, for callers writing results as they go."""
+        store_user_ids = np.unique(np.asarray(store_user_ids, dtype=np.int64))
+        available = self.available()
+        for start in range(0, len(store_user_ids), chunk_size):
+            chunk = store_user_ids[start:start + chunk_size]
+            seeds = load_user_interactions(chunk, self.index.product_ids)
+            seeds.data[:] = 1
+            if self.item_factors is not None:
+                top = self._top_factor_positions(seeds, top_n, purchased_penalty, available)
             else:
-                scores[pid] *= 0.1
-
-        # sort items by score
-        ranked = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)
-        top_ids = [pid for pid, _ in ranked[:top_n]]
-        # fetch product instances (preserve order)
-        products = list(Product.objects.filter(id__in=top_ids))
-        # sort products in same order as top_ids
-        prod_map = {p.id: p for p in products}
-        return [prod_map[i] for i in top_ids if i in prod_map]
-
-    def _cold_start_recommend(self, top_n=10):
-        # simple fallback — recommend most-reviewed or top-priced or same-category popular
-        # We'll return the top products by number of reviews
-        qs = Product.objects.annotate(num_reviews=pd.NamedAgg(column='reviews', aggfunc='count')).order_by('-num_reviews')[:top_n]
-        return list(qs)
+                scores = (seeds @ self.item_similarity()).tocsr()
+                # remove already purchased
+                seed_scores = scores.multiply(seeds)
+                scores = (scores - (seed_scores if purchased_penalty else 0.9 * seed_scores)).tocsr()
+                scores.data[~available[scores.indices]] = 0
+                top = top_n_per_row(scores.indptr, scores.indices, scores.data, top_n)
+            yield {user_id: self.index.product_ids[positions].tolist()
+                   for user_id, positions in zip(chunk.tolist(), top)}
+
+    def item_similarity(self):
+        """The neighbor index as a sparse (items x items) matrix, built once per index."""
+        cached = self._item_similarity
+        if cached is None or cached[0] is not self.index:
+            n_items = len(self.index)
+            matrix = sparse.csr_matrix((self.index.float_scores(), self.index.indices, self.index.indptr),
+                                       shape=(n_items, n_items))
+            cached = (self.index, matrix)
+            self._item_similarity = cached
+        return cached[1]
+
+    def _factor_scores(self, seeds):
+        """ALS scores of every item for users given as a sparse (users x items) matrix of their seeds."""
+        users = als.fold_in(seeds, self.item_factors, self.item_gram, alpha=self.config.get('alpha', als.ALPHA))
+        return users @ np.asarray(self.item_factors).T
+
+    def _top_factor_positions(self, seeds, top_n, purchased_penalty, available):
+        # dense scores, so users are scored in blocks of bounded size
+        top = []
+        step = auto_block_size(len(self.index))
+        for start in range(0, seeds.shape[0], step):
+            block = seeds[start:start + step]
+            for scores, seed_positions in zip(self._factor_scores(block), np.split(block.indices, block.indptr[1:-1])):
+                scores[seed_positions] = 0 if purchased_penalty else scores[seed_positions] * 0.1
+                scores[~available] = 0
+                top.append(top_n_positions(scores, top_n))
+        return top
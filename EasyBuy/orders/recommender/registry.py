@@ -0,0 +1,101 @@
+"""
+Serving-side holder of the current recommender model.
+
+Web workers ask the registry for the model on every request. At most every
+RECOMMENDER_RELOAD_INTERVAL seconds it checks the CURRENT pointer of the artifact (one small
+file read); when a new version was published it is loaded on a background thread and swapped
+in with a single reference assignment. Requests that already hold the old model finish on it.
+"""
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+
+from .artifact import MODEL_PATH, current_version
+from .serving import ServingModel
+
+logger = logging.getLogger(__name__)
+
+RELOAD_INTERVAL = 5.0
+
+
+class ModelRegistry:
+    def __init__(self, path=MODEL_PATH, reload_interval=RELOAD_INTERVAL, loader=None):
+        """
+        loader: callable opening one artifact version directory, defaults to ServingModel.load
+        """
+        self.path = path
+        self.reload_interval = reload_interval
+        self._loader = loader
+        self._model = None
+        self._checked_at = None
+        self._reloading = False
+        self._lock = threading.Lock()
+
+    @property
+    def version(self):
+        model = self._model
+        return model.model_version if model is not None else None
+
+    def get(self):
+        """
+        The model to serve, or None if no model was published yet.
+        The first model is loaded synchronously; later versions are swapped in by a background
+        thread, so a request never waits for a reload.
+        """
+        model = self._model
+        if self._claim_check():
+            if model is None:
+                self._reload()
+                model = self._model
+            else:
+                threading.Thread(target=self._reload, daemon=True).start()
+        return model
+
+    def _claim_check(self):
+        with self._lock:
+            now = time.monotonic()
+            if self._reloading or (self._checked_at is not None and now - self._checked_at < self.reload_interval):
+                return False
+            self._checked_at = now
+            self._reloading = True
+            return True
+
+    def _reload(self):
+        try:
+            self.reload()
+        except FileNotFoundError:
+            # nothing published yet
+            pass
+        except Exception:
+            logger.exception("Could not load recommender from %s, still serving version %s", self.path, self.version)
+        finally:
+            with self._lock:
+                self._reloading = False
+
+    def reload(self):
+        """Load the published version if it is not the one being served. Returns True if the model was swapped."""
+        version = current_version(self.path)
+        if version == self.version:
+            return False
+        loader = self._loader or ServingModel.load
+        model = loader(os.path.join(self.path, version))
+        # cached recommendations are keyed by model version, so nothing needs invalidating here
+        self._model = model
+        logger.info("Serving recommender version %s", version)
+        return True
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    """The process-wide ModelRegistry for MODEL_PATH, reloading every RECOMMENDER_RELOAD_INTERVAL seconds."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ModelRegistry(reload_interval=getattr(settings, 'RECOMMENDER_RELOAD_INTERVAL', RELOAD_INTERVAL))
+        return _registry
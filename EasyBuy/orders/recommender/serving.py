@@ -0,0 +1,227 @@
+"""
+Request-time side of the recommender.
+
+Web workers and the MCP server only read published artifacts, so everything they call lives
+here and imports nothing but NumPy and Django: no pandas, SciPy, scikit-learn or joblib is
+loaded in a serving process. Building, batch scoring and incremental updates stay in the
+training modules (recommender.py and the modules it imports), which subclass ServingModel.
+"""
+import numpy as np
+from django.db.models import Max, Q
+
+from products.models import Product, Review
+from orders.models import OrderItem
+from core.models import StoreUser
+from .artifact import MODEL_PATH, read_artifact
+from .cache import get_cache
+from .index import NeighborIndex, DEFAULT_TOP_K, top_n_positions
+from .pipeline import get_cart_pipeline, get_pipeline
+from .popularity import popular_products
+from .stock import get_stock
+
+# ALS confidence weight, see als.py
+ALPHA = 10.0
+
+
+def fold_in_user(seed_positions, confidence, item_factors, item_gram):
+    """
+    Factors of one user that was not part of training from the positions of the items they
+    interacted with and alpha * r of each, without touching the item factors (one exact f x f solve).
+    """
+    observed = item_factors[seed_positions]
+    a = item_gram + (observed.T * confidence) @ observed
+    return np.linalg.solve(a, (1 + confidence) @ observed)
+
+
+class ServingModel:
+    def __init__(self, index=None, config=None, model_version=None, item_factors=None, item_gram=None,
+                 pipeline=None, build_version=None, cart_pipeline=None):
+        """
+        index: NeighborIndex with the top-K item-item similarities of each product
+        config: dict with hyperparams (weights, top_k)
+        model_version: version string of the artifact the model was loaded from
+        item_factors, item_gram: ALS item factors and their regularized gram matrix, only for
+                                 models built with the 'als' backend; users are then scored by
+                                 folding them in and taking dot products with item_factors
+        pipeline: RecommendationPipeline serving users, defaults to get_pipeline()
+        build_version: version of the full build the artifact comes from; incremental updates
+                       publish new model versions of the same build
+        cart_pipeline: RecommendationPipeline serving carts, defaults to the neighbors-only
+                       get_cart_pipeline()
+        """
+        self.index = index
+        self.config = config or {'content_weight': 0.5, 'collab_weight': 0.5, 'top_k': DEFAULT_TOP_K}
+        self.model_version = model_version
+        self.item_factors = item_factors
+        self.item_gram = item_gram
+        self.pipeline = pipeline
+        self.build_version = build_version
+        self.cart_pipeline = cart_pipeline
+        # (out-of-stock ids, availability mask over index positions) last computed from them
+        self._availability = None
+        # (seed positions, their index.seed_neighbors), shared by the candidate and ranking stages
+        self._seed_neighbors = None
+
+    @classmethod
+    def load(cls, path=MODEL_PATH, mmap=True):
+        """
+        Open a saved model. Arrays are memory-mapped read-only, so loading is instant
+        and all worker processes share one copy through the OS page cache.
+        """
+        arrays, manifest = read_artifact(path, mmap=mmap)
+        return cls(index=NeighborIndex.from_arrays(arrays),
+                   config=manifest['meta'].get('config', {}),
+                   model_version=manifest['model_version'],
+                   # artifacts saved before build versions were recorded
+                   build_version=manifest['meta'].get('build_version', manifest['model_version']),
+                   item_factors=arrays.get('item_factors'),
+                   item_gram=arrays.get('item_gram'))
+
+    def get_similar_items(self, product_id, top_n=10):
+        # neighbor rows are stored pre-sorted and never contain the product itself
+        return [pid for pid, _ in self.index.neighbors(product_id, top_n=top_n)]
+
+    def recommend_for_user(self, store_user_id, top_n=10, purchased_penalty=True):
+        """
+        For a user: take items they purchased/have high rating for, rank the candidates the
+        pipeline (pipeline.py) generates from them. Results are cached per user and build version
+        (see cache.py) until the user buys or reviews something, so repeat calls skip the DB and
+        the scoring entirely. Incremental updates keep the build version: they only change the
+        rows of the users and products they touch, whose cache entries are invalidated per user.
+        """
+        if self.build_version is None:
+            return self._recommend_for_user(store_user_id, top_n, purchased_penalty)
+        cache = get_cache()
+        products = cache.get(store_user_id, self.build_version, top_n, purchased_penalty)
+        if products is not None and not get_stock().all_available([p.id for p in products]):
+            # cached before some of these products ran out of stock
+            products = None
+        if products is None:
+            products = self._recommend_for_user(store_user_id, top_n, purchased_penalty)
+            cache.set(store_user_id, self.build_version, products, top_n, purchased_penalty)
+        return products
+
+    def _recommend_for_user(self, store_user_id, top_n=10, purchased_penalty=True):
+        # get user's purchased items and review ratings
+        # we prefer DB calls here to stay up-to-date
+        try:
+            su = StoreUser.objects.get(id=store_user_id)
+        except StoreUser.DoesNotExist:
+            return []
+
+        # purchases
+        orderitems = OrderItem.objects.select_related('order', 'product').filter(order__store_user=su, order__status='COMPLETED')
+        purchased_ids = [oi.product.id for oi in orderitems if oi.product]
+        # reviews
+        reviews = Review.objects.filter(reviewer=su).select_related('product')
+        rated_ids = [r.product.id for r in reviews if r.product]
+
+        seed_items = list(set(purchased_ids + rated_ids))
+        if not seed_items:
+            # cold start: recommend top popular or by category fallback
+            return self._cold_start_recommend(top_n)
+
+        top_ids = self.candidate_pipeline().recommend(self, seed_items, top_n, exclude_seeds=purchased_penalty,
+                                                      available=self.available())
+        # fetch product instances (preserve order)
+        products = list(Product.objects.filter(id__in=top_ids))
+        # sort products in same order as top_ids
+        prod_map = {p.id: p for p in products}
+        return [prod_map[i] for i in top_ids if i in prod_map]
+
+    def recommend_from_seeds(self, seed_ids, top_n=10, purchased_penalty=True, available=None):
+        """
+        Ids of the top_n products most similar to the seed products, without any DB access.
+        Scores the whole catalog; requests go through the candidate pipeline instead.
+        available: optional boolean mask over index positions (see available()); products
+                   marked False are skipped before the top_n selection
+        """
+        seed_positions = self.index.positions_of(seed_ids)
+        if not len(seed_positions):
+            return []
+
+        if self.item_factors is not None:
+            scores = np.asarray(self.item_factors) @ self._fold_in(seed_positions)
+        else:
+            # aggregate similarity scores of all seeds in one vectorized pass
+            scores = self.index.score_seeds(seed_positions)
+
+        # remove already purchased
+        if purchased_penalty:
+            scores[seed_positions] = 0
+        else:
+            scores[seed_positions] *= 0.1
+        if available is not None:
+            scores[~available] = 0
+
+        # partial sort: only the top_n candidates are ordered
+        top_positions = top_n_positions(scores, top_n)
+        return self.index.product_ids[top_positions].tolist()
+
+    def recommend_for_cart(self, cart_product_ids, top_n=10):
+        """
+        "You may also need" products for a cart: the most similar to the carted products that are
+        neither in the cart nor out of stock, ranked in memory from their neighbor rows
+        (get_cart_pipeline). A single query loads the chosen products.
+        """
+        pipeline = self.cart_pipeline or get_cart_pipeline()
+        top_ids = pipeline.recommend(self, cart_product_ids, top_n, available=self.available())
+        if not top_ids:
+            return []
+        products = Product.objects.in_bulk(top_ids)
+        return [products[pid] for pid in top_ids if pid in products]
+
+    def score_candidates(self, seed_positions, positions):
+        """Model scores of the products at `positions` for the seeds, without scoring the rest of the catalog."""
+        scores = np.zeros(len(positions), dtype=np.float32)
+        if not len(seed_positions):
+            return scores
+        if self.item_factors is not None:
+            return np.asarray(self.item_factors)[positions] @ self._fold_in(seed_positions)
+        reached, reached_scores = self.seed_neighbors(seed_positions)
+        if len(reached):
+            pos = np.minimum(np.searchsorted(reached, positions), len(reached) - 1)
+            hit = reached[pos] == positions
+            scores[hit] = reached_scores[pos[hit]]
+        return scores
+
+    def seed_neighbors(self, seed_positions):
+        """index.seed_neighbors, kept for the last seed array it was called with."""
+        cached = self._seed_neighbors
+        if cached is None or cached[0] is not seed_positions:
+            cached = (seed_positions, self.index.seed_neighbors(seed_positions))
+            self._seed_neighbors = cached
+        return cached[1]
+
+    def candidate_pipeline(self):
+        return self.pipeline or get_pipeline()
+
+    def available(self):
+        """Boolean mask of the index positions currently in stock, rebuilt only when stock changed."""
+        out_of_stock = get_stock().out_of_stock()
+        cached = self._availability
+        if cached is None or cached[0] is not out_of_stock:
+            cached = (out_of_stock, get_stock().mask(self.index.product_ids, out_of_stock))
+            self._availability = cached
+        return cached[1]
+
+    def _fold_in(self, seed_positions):
+        confidence = np.full(len(seed_positions), self.config.get('alpha', ALPHA), dtype=np.float32)
+        return fold_in_user(seed_positions, confidence, self.item_factors, self.item_gram)
+
+    def _cold_start_recommend(self, top_n=10):
+        # users without purchases or reviews get the currently trending products
+        return popular_products(limit=top_n)
+
+
+def bought_together(product_ids, limit=10):
+    """
+    Products most often bought with all of `product_ids` (a list or a values('product_id')
+    subquery, e.g. a cart), best first, in one query over the rules mined by baskets.py:
+    pair rules of any of the products plus triple rules whose two antecedents are both among them.
+    """
+    rules = Q(bought_with__antecedent__in=product_ids) & (
+        Q(bought_with__with_product__isnull=True) | Q(bought_with__with_product__in=product_ids))
+    return list(Product.objects.filter(rules).exclude(id__in=product_ids)
+                .annotate(confidence=Max('bought_with__confidence'))
+                .order_by('-confidence', 'id')[:limit])
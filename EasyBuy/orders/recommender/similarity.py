@@ -0,0 +1,78 @@
+import numpy as np
+from joblib import Parallel, delayed
+from scipy import sparse
+from sklearn.metrics.pairwise import cosine_similarity
+
+from .index import top_k_rows
+
+# upper bound on rows of the similarity matrix computed at once during build
+BLOCK_SIZE = 1024
+# upper bound on cells of one dense block (~128MB of float32) so wide catalogs get shorter blocks
+MAX_BLOCK_CELLS = 2 ** 25
+
+
+def similarity_rows(positions, content, item_matrix, content_weight, collab_weight, content_neighbors=None):
+    """
+    Combined content + collaborative similarity of the items at positions against every item.
+
+    content: (n_items x n_features) TF-IDF matrix
+    item_matrix: (n_items x n_users) interaction matrix, or (n_items x n_factors) ALS item factors,
+                 or None for content-only models
+    content_neighbors: optional sparse (n_items x n_items) approximate content similarities
+                       (see ann.lsh_neighbors), used instead of exact cosine over content
+    Returns a len(positions) x n_items block: dense, or with content_neighbors and no dense ALS
+    factors a sparse CSR one, so the approximate path never materializes n_items columns per row.
+    """
+    if content_neighbors is not None:
+        block = content_weight * sparse.csr_matrix(content_neighbors[positions])
+        if item_matrix is None:
+            return block
+        collab = collab_weight * cosine_similarity(item_matrix[positions], item_matrix, dense_output=False)
+        if sparse.issparse(collab):
+            return (block + collab).tocsr()
+        # ALS factors score every pair anyway: add the sparse content rows in place
+        coo = block.tocoo()
+        np.add.at(collab, (coo.row, coo.col), coo.data)
+        return collab
+    block = content_weight * cosine_similarity(content[positions], content)
+    if item_matrix is not None:
+        block += collab_weight * cosine_similarity(item_matrix[positions], item_matrix)
+    return block
+
+
+def auto_block_size(n_items):
+    return int(max(1, min(BLOCK_SIZE, MAX_BLOCK_CELLS // max(n_items, 1))))
+
+
+def _top_k_block(start, end, content, item_matrix, content_weight, collab_weight, k, content_neighbors):
+    positions = np.arange(start, end)
+    block = similarity_rows(positions, content, item_matrix, content_weight, collab_weight, content_neighbors)
+    return top_k_rows(block, k, row_offset=start)
+
+
+def top_k_neighbors(content, item_matrix, content_weight, collab_weight, k, block_size=None, workers=1,
+                    content_neighbors=None):
+    """
+    Top-k combined-similarity neighbors of every item, as a list of (indices, scores) rows.
+
+    Row blocks are scored in a joblib process pool of `workers` processes (-1 = all cores).
+    Each worker only returns the top-k of its block, so peak memory per worker is
+    block_size x n_items no matter how large the catalog is.
+    """
+    n_items = content.shape[0]
+    block_size = block_size or auto_block_size(n_items)
+    spans = [(start, min(start + block_size, n_items)) for start in range(0, n_items, block_size)]
+    args = (content, item_matrix, content_weight, collab_weight, k, content_neighbors)
+    if workers == 1:
+        blocks = [_top_k_block(start, end, *args) for start, end in spans]
+    else:
+        blocks = Parallel(n_jobs=workers)(delayed(_top_k_block)(start, end, *args) for start, end in spans)
+    return [row for block in blocks for row in block]
+
+
+def top_k_cosine(X, k, block_size=None, workers=1):
+    """
+    Top-k cosine neighbors of every row of the sparse matrix X (excluding the row itself),
+    computed block by block like top_k_neighbors, so memory stays block_size x n_rows.
+    """
+    return top_k_neighbors(X, None, 1.0, 0.0, k, block_size=block_size, workers=workers)
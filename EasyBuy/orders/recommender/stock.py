@@ -0,0 +1,88 @@
+"""
+In-memory product availability for the ranking step.
+
+The ids of out-of-stock products, usually a small share of the catalog, are kept per process
+as a sorted array. A model turns them into a boolean mask aligned with its neighbor index
+(`mask`), so unavailable products are dropped before the top-N selection: result lists stay
+full and no stock query is made per request.
+
+Stock saved through the ORM in this process is applied as soon as it commits (see signals.py);
+changes from other processes or queryset.update() are picked up by a resync from the DB at
+most every RECOMMENDER_STOCK_SYNC_INTERVAL seconds.
+"""
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+
+from products.models import Product
+
+SYNC_INTERVAL = 5.0
+
+
+class StockMap:
+    def __init__(self, sync_interval=SYNC_INTERVAL):
+        self.sync_interval = sync_interval
+        self._out_of_stock = None
+        self._synced_at = 0.0
+        self._lock = threading.Lock()
+
+    def out_of_stock(self):
+        """Sorted ids of the products that can't be bought right now; a new array after every change."""
+        if self._out_of_stock is None or time.monotonic() - self._synced_at >= self.sync_interval:
+            self.sync()
+        return self._out_of_stock
+
+    def sync(self):
+        ids = np.fromiter(Product.objects.filter(quantity__lte=0).values_list('id', flat=True).iterator(),
+                          dtype=np.int64)
+        ids.sort()
+        with self._lock:
+            self._out_of_stock = ids
+            self._synced_at = time.monotonic()
+
+    def set_available(self, product_id, available):
+        """Apply one product's stock change without a resync."""
+        with self._lock:
+            ids = self._out_of_stock
+            if ids is None:
+                # nothing loaded yet, the first sync reads the current stock
+                return
+            pos = int(np.searchsorted(ids, product_id))
+            listed = pos < len(ids) and ids[pos] == product_id
+            if available and listed:
+                self._out_of_stock = np.delete(ids, pos)
+            elif not available and not listed:
+                self._out_of_stock = np.insert(ids, pos, product_id)
+
+    def mask(self, product_ids, out_of_stock=None):
+        """Availability of every product in the sorted product_ids array, e.g. a model's index positions."""
+        out_of_stock = self.out_of_stock() if out_of_stock is None else out_of_stock
+        available = np.ones(len(product_ids), dtype=bool)
+        if len(out_of_stock) and len(product_ids):
+            pos = np.minimum(np.searchsorted(product_ids, out_of_stock), len(product_ids) - 1)
+            available[pos[product_ids[pos] == out_of_stock]] = False
+        return available
+
+    def all_available(self, product_ids):
+        """Whether none of the given (unsorted) product ids is out of stock."""
+        out_of_stock = self.out_of_stock()
+        if not len(out_of_stock):
+            return True
+        ids = np.asarray(product_ids, dtype=np.int64)
+        pos = np.minimum(np.searchsorted(out_of_stock, ids), len(out_of_stock) - 1)
+        return not np.any(out_of_stock[pos] == ids)
+
+
+_stock = None
+_stock_lock = threading.Lock()
+
+
+def get_stock():
+    """Process-wide StockMap, configured from RECOMMENDER_STOCK_SYNC_INTERVAL."""
+    global _stock
+    with _stock_lock:
+        if _stock is None:
+            _stock = StockMap(sync_interval=getattr(settings, 'RECOMMENDER_STOCK_SYNC_INTERVAL', SYNC_INTERVAL))
+        return _stock
@@ -0,0 +1,39 @@
+"""
+Queue of pending incremental recommender updates.
+
+Signal handlers run inside web requests, so they only record which users and products changed
+in the RecommenderUpdate table (one INSERT; repeated changes coalesce) and import nothing but
+Django. The `update_recommender` management command drains the queue in its own process
+(incremental.process_updates): re-vectorizing product text, re-solving rows and rewriting the
+artifact never load SciPy or scikit-learn into a web worker, nor take time from a request.
+"""
+from django.conf import settings
+from django.db import transaction
+
+from orders.models import RecommenderUpdate
+
+
+def updates_enabled():
+    return getattr(settings, 'RECOMMENDER_INCREMENTAL_UPDATES', True)
+
+
+def queue_updates(kind, object_ids):
+    """Queue RecommenderUpdate.USER or .PRODUCT ids for the next update_recommender run."""
+    RecommenderUpdate.objects.bulk_create(
+        [RecommenderUpdate(kind=kind, object_id=object_id) for object_id in object_ids],
+        ignore_conflicts=True,
+    )
+
+
+def take_updates():
+    """
+    Remove and return the queued ids as {kind: sorted ids}. Changes queued while the caller
+    works on them are new rows, picked up by the next call.
+    """
+    with transaction.atomic():
+        rows = list(RecommenderUpdate.objects.values_list('pk', 'kind', 'object_id'))
+        RecommenderUpdate.objects.filter(pk__in=[pk for pk, _, _ in rows]).delete()
+    pending = {RecommenderUpdate.USER: [], RecommenderUpdate.PRODUCT: []}
+    for _, kind, object_id in rows:
+        pending[kind].append(object_id)
+    return {kind: sorted(ids) for kind, ids in pending.items()}
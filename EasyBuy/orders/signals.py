@@ -0,0 +1,83 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from products.models import Product, Review
+from .models import Order, OrderItem, RecommenderUpdate
+from .recommender.cache import get_cache
+from .recommender.popularity import record_purchases
+from .recommender.stock import get_stock
+from .recommender.updates import queue_updates, updates_enabled
+
+
+@receiver(pre_save, sender=Order)
+def remember_previous_status(sender, instance, **kwargs):
+    """Keep the status stored in the DB so post_save can detect a transition."""
+    instance._previous_status = (
+        Order.objects.filter(pk=instance.pk).values_list('status', flat=True).first()
+        if instance.pk else None
+    )
+
+
+@receiver(post_save, sender=Order)
+def update_recommender_on_completion(sender, instance, created, **kwargs):
+    if instance.status == 'COMPLETED' and getattr(instance, '_previous_status', None) != 'COMPLETED':
+        _refresh_user_recommendations(instance.store_user_id)
+        if not created:
+            # items added after this point are counted by update_popularity_on_purchase
+            rows = [row + (instance.ordered_at,) for row in instance.orderitem_set.filter(product__isnull=False)
+                    .values_list('product_id', 'product__category', 'quantity')]
+            _record_purchases(rows)
+
+
+@receiver(post_save, sender=OrderItem)
+def update_popularity_on_purchase(sender, instance, created, **kwargs):
+    if created and instance.product_id is not None and instance.order.status == 'COMPLETED':
+        _record_purchases([(instance.product_id, instance.product.category, instance.quantity,
+                            instance.order.ordered_at)])
+
+
+@receiver(post_save, sender=Product)
+def update_stock_availability(sender, instance, **kwargs):
+    # orders reduce stock and restocks raise it through Product.save()
+    available = instance.quantity > 0
+    transaction.on_commit(lambda: get_stock().set_available(instance.pk, available))
+    _refresh_content_features(instance.pk)
+
+
+@receiver(m2m_changed, sender=Product.tags.through)
+def update_features_on_tags(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        for product_id in (pk_set or ()) if reverse else [instance.pk]:
+            _refresh_content_features(product_id)
+
+
+@receiver(post_save, sender=Review)
+def update_recommender_on_review(sender, instance, **kwargs):
+    _refresh_user_recommendations(instance.reviewer_id)
+    _refresh_content_features(instance.product_id)
+
+
+@receiver(post_delete, sender=Review)
+def update_features_on_review_delete(sender, instance, **kwargs):
+    _refresh_content_features(instance.product_id)
+
+
+def _refresh_user_recommendations(store_user_id):
+    # the model itself is updated by the update_recommender command, requests only queue the user
+    def on_commit():
+        get_cache().invalidate_user(store_user_id)
+        if updates_enabled():
+            queue_updates(RecommenderUpdate.USER, [store_user_id])
+    transaction.on_commit(on_commit)
+
+
+def _refresh_content_features(product_id):
+    # queued on every product save; unchanged text (e.g. stock updates) is skipped by the updater
+    if updates_enabled():
+        transaction.on_commit(lambda: queue_updates(RecommenderUpdate.PRODUCT, [product_id]))
+
+
+def _record_purchases(rows):
+    if rows:
+        transaction.on_commit(lambda: record_purchases(rows))
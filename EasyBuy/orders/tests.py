@@ -1,3 +1,553 @@
-from django.test import TestCase
+import json
+import subprocess
+import sys
+import textwrap
+import time
+from datetime import datetime, timedelta, timezone
 
-# Create your tests here.
+import numpy as np
+import pytest
+from scipy import sparse
+from sklearn.metrics.pairwise import cosine_similarity
+
+from orders.models import (Order, OrderItem, ProductAssociation, ProductFeatures, ProductPopularity,
+                           RecommenderUpdate)
+from orders.recommender.ann import lsh_neighbors, recall_report
+from orders.recommender.artifact import ArtifactError, publish_artifact, read_artifact, write_artifact
+from orders.recommender.baskets import mine_associations
+from orders.recommender.benchmark import run_benchmark
+from orders.recommender.cache import LRUCache, RecommendationCache, get_cache
+from orders.recommender import features
+from orders.recommender.features import refresh_features
+from orders.recommender.incremental import process_updates, update_products, update_users
+from orders.recommender.popularity import decayed_score, popular_products, record_purchases, refresh_popularity
+from orders.recommender.index import NeighborIndex, ranking_agreement, top_k_rows, top_n_positions
+from orders.recommender.pipeline import NeighborCandidates, RecommendationPipeline
+from orders.recommender.profiling import StageProfiler
+from orders.recommender.recommender import Recommender
+from orders.recommender.registry import ModelRegistry
+from orders.recommender.serving import ServingModel, bought_together
+from orders.recommender.similarity import similarity_rows, top_k_cosine
+from orders.recommender.stock import get_stock
+from products.models import Product, Review
+
+
+def test_top_k_rows_skips_self_and_sorts_descending():
+    sim = np.array([
+        [1.0, 0.2, 0.9, 0.0],
+        [0.2, 1.0, 0.1, 0.5],
+    ])
+    rows = top_k_rows(sim, k=2)
+
+    assert rows[0][0].tolist() == [2, 1]
+    assert rows[1][0].tolist() == [3, 0]
+    assert np.allclose(rows[1][1], [0.5, 0.2])
+    # sparse blocks rank only their stored entries, with the same result
+    for (idx, scores), (sparse_idx, sparse_scores) in zip(rows, top_k_rows(sparse.csr_matrix(sim), k=2)):
+        assert sparse_idx.tolist() == idx.tolist() and np.allclose(sparse_scores, scores)
+
+
+def test_neighbor_index_from_blocks_matches_dense_ranking():
+    rng = np.random.default_rng(0)
+    sim = rng.random((6, 6))
+    sim = (sim + sim.T) / 2
+    product_ids = np.array([10, 20, 30, 40, 50, 60])
+
+    blocks = [(0, sim[:4]), (4, sim[4:])]
+    index = NeighborIndex.from_blocks(product_ids, blocks, k=3)
+
+    for pos, pid in enumerate(product_ids):
+        row = sim[pos].copy()
+        row[pos] = -np.inf
+        expected = product_ids[np.argsort(-row)[:3]].tolist()
+        assert [p for p, _ in index.neighbors(pid, top_n=3)] == expected
+    assert index.neighbors(999) == []
+
+
+def test_score_seeds_sums_neighbor_rows():
+    sim = np.array([
+        [1.0, 0.8, 0.1, 0.3],
+        [0.8, 1.0, 0.4, 0.0],
+        [0.1, 0.4, 1.0, 0.6],
+        [0.3, 0.0, 0.6, 1.0],
+    ])
+    index = NeighborIndex.from_blocks(np.arange(4), [(0, sim)], k=3)
+
+    scores = index.score_seeds([0, 1])
+    # the diagonal is never stored, so each seed only picks up the other's score
+    assert np.allclose(scores, [0.8, 0.8, 0.5, 0.3])
+    positions, reached = index.seed_neighbors([0, 1])
+    assert np.allclose(reached, scores[positions])
+
+    scores[[0, 1]] = 0
+    assert top_n_positions(scores, 1).tolist() == [2]
+    assert top_n_positions(scores, 10).tolist() == [2, 3]
+
+
+def test_quantized_index_keeps_rankings_in_a_quarter_of_the_score_bytes(tmp_path):
+    rng = np.random.default_rng(2)
+    sim = rng.random((50, 50))
+    index = NeighborIndex.from_blocks(np.arange(50), [(0, (sim + sim.T) / 2)], k=10)
+    quantized = index.quantize()
+
+    assert quantized.scores.dtype == np.uint8 and quantized.scores.nbytes * 4 == index.scores.nbytes
+    assert np.allclose(quantized.float_scores(), index.scores, atol=1 / 510)
+    assert [p for p, _ in quantized.neighbors(7)] == [p for p, _ in index.neighbors(7)]
+    assert ranking_agreement(index, quantized, sample_size=50)['overlap_at_n'] > 0.9
+
+    write_artifact(tmp_path, quantized.to_arrays())
+    loaded = NeighborIndex.from_arrays(read_artifact(tmp_path)[0])
+    assert loaded.quantized and np.array_equal(loaded.score_seeds([1, 2]), quantized.score_seeds([1, 2]))
+
+    # replaced rows are quantized against their own maximum
+    updated = quantized.replace_rows([3], [(np.array([5, 6], dtype=np.int32), np.array([2.0, 1.0], dtype=np.float32))])
+    assert updated.neighbors(3) == [(5, 2.0), (6, pytest.approx(1.0, abs=0.01))]
+    assert updated.neighbors(4) == quantized.neighbors(4)
+
+
+def test_blocked_top_k_cosine_matches_dense_search():
+    X = sparse.random(200, 40, density=0.05, format='csr', random_state=3, dtype=np.float32)
+
+    dense = top_k_rows(cosine_similarity(X), k=4)
+    blocked = top_k_cosine(X, k=4, block_size=17)
+
+    for (dense_idx, dense_scores), (idx, scores) in zip(dense, blocked):
+        assert idx.tolist() == dense_idx.tolist()
+        assert np.array_equal(scores, dense_scores)
+
+
+def test_artifact_round_trip_is_memory_mapped(tmp_path):
+    rng = np.random.default_rng(1)
+    index = NeighborIndex.from_blocks(np.arange(1, 9), [(0, rng.random((8, 8)))], k=3)
+    write_artifact(tmp_path, index.to_arrays(), meta={'config': {'top_k': 3}})
+
+    arrays, manifest = read_artifact(tmp_path)
+    loaded = NeighborIndex.from_arrays(arrays)
+
+    assert isinstance(arrays['scores'], np.memmap)
+    assert manifest['meta']['config'] == {'top_k': 3}
+    assert loaded.neighbors(4) == index.neighbors(4)
+
+
+def test_artifact_with_unknown_version_is_rejected(tmp_path):
+    write_artifact(tmp_path, {'scores': np.zeros(3, dtype=np.float32)})
+    manifest = json.loads((tmp_path / 'manifest.json').read_text())
+    manifest['version'] += 1
+    (tmp_path / 'manifest.json').write_text(json.dumps(manifest))
+
+    with pytest.raises(ArtifactError):
+        read_artifact(tmp_path)
+
+
+def test_registry_swaps_in_published_versions(tmp_path):
+    index = NeighborIndex.from_blocks(np.arange(3), [(0, np.ones((3, 3)))], k=2)
+    registry = ModelRegistry(tmp_path, reload_interval=0, loader=Recommender.load)
+    assert registry.get() is None
+
+    first = publish_artifact(tmp_path, index.to_arrays())
+    old = registry.get()
+    assert old.model_version == first['model_version']
+
+    for _ in range(3):
+        latest = publish_artifact(tmp_path, index.to_arrays())
+    assert registry.reload()
+    assert registry.get().model_version == latest['model_version']
+    # the old version's files may be pruned, but its memory maps stay usable
+    assert old.get_similar_items(0) == [1, 2]
+    assert len([p for p in tmp_path.iterdir() if (p / 'manifest.json').exists()]) == 3
+    assert read_artifact(tmp_path)[1]['model_version'] == latest['model_version']
+
+
+def test_pipeline_ranks_generated_candidates_within_the_latency_budget():
+    sim = np.array([
+        [1.0, 0.8, 0.1, 0.3],
+        [0.8, 1.0, 0.4, 0.0],
+        [0.1, 0.4, 1.0, 0.6],
+        [0.3, 0.0, 0.6, 1.0],
+    ])
+    model = ServingModel(index=NeighborIndex.from_blocks(np.arange(1, 5), [(0, sim)], k=3))
+    # with neighbor candidates only, the ranking is the one of scoring the whole catalog
+    neighbors_only = RecommendationPipeline([NeighborCandidates()])
+    assert neighbors_only.recommend(model, [1, 2], top_n=2) == model.recommend_from_seeds([1, 2], top_n=2) == [3, 4]
+
+    def rules(model, seed_ids, seed_positions):
+        return np.array([3]), np.array([0.9], dtype=np.float32)
+
+    def broken(model, seed_ids, seed_positions):
+        raise RuntimeError("database is down")
+
+    def slow(model, seed_ids, seed_positions):
+        time.sleep(0.05)
+        return np.array([2]), np.array([1.0], dtype=np.float32)
+
+    rules.name, broken.name, slow.name = 'rules', 'broken', 'slow'
+    pipeline = RecommendationPipeline([NeighborCandidates(), rules, broken, slow], weights={'rules': 5.0}, budget_ms=20)
+    trace = {}
+    # a strong extra signal reorders the candidates
+    assert pipeline.recommend(model, [1, 2], top_n=2, trace=trace) == [4, 3]
+    assert trace['skipped'] == ['broken']
+    assert [stage['stage'] for stage in trace['stages']] == ['neighbors', 'rules', 'slow', 'rank']
+
+    # slow took longer than the whole budget, so it is dropped until its estimate decays
+    assert pipeline.recommend(model, [1, 2], top_n=2, trace=trace) == [4, 3]
+    assert trace['skipped'] == ['broken', 'slow']
+
+
+def test_serving_does_not_import_the_training_stack(settings):
+    # what a web worker or the MCP server runs: the apps, the URLconf, the served model and the
+    # signal handlers of a checkout and a review, in a fresh process with its own test database
+    code = textwrap.dedent("""
+        import sys, django
+        django.setup()
+        from django.db import connection, transaction
+        from django.urls import get_resolver
+        get_resolver().url_patterns
+        import orders.recommender.serving
+        if connection.vendor != 'sqlite':
+            connection.settings_dict['TEST']['NAME'] = 'test_serving_imports'
+        name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0)
+        from django.contrib.auth.models import User
+        from core.models import StoreUser
+        from orders.models import Order, OrderItem, RecommenderUpdate
+        from products.models import Product, Review
+        with transaction.atomic():
+            user = StoreUser.objects.create(user=User.objects.create_user(username='u', password='p'),
+                                            contact_number='+921111111111', role='buyer')
+            product = Product.objects.create(name='Phone', slug='phone', category='other', seller=user)
+            order = Order.objects.create(store_user=user, total_amount=1, shipping_address='x', status='COMPLETED')
+            OrderItem.objects.create(order=order, product=product, quantity=1, price_at_purchase=1)
+            product.quantity = 0
+            product.save()
+            Review.objects.create(product=product, reviewer=user, rating=5, review='great')
+        print(RecommenderUpdate.objects.count())
+        print(sorted(m for m in ('joblib', 'pandas', 'scipy', 'sklearn') if m in sys.modules))
+        connection.creation.destroy_test_db(name, verbosity=0)
+    """)
+    result = subprocess.run([sys.executable, '-c', code], cwd=settings.BASE_DIR, capture_output=True,
+                            text=True, check=True)
+    # the user and the product were queued for update_recommender
+    assert result.stdout.split('\n')[:2] == ['2', '[]']
+
+
+def test_queued_updates_are_applied_by_the_update_command(catalog, complete_order, settings, tmp_path,
+                                                          django_capture_on_commit_callbacks):
+    settings.RECOMMENDER_INCREMENTAL_UPDATES = True
+    (alice, bob, _), products = catalog
+    complete_order(alice, products[:2])
+    Recommender.build(content_weight=0, collab_weight=1, top_k=3).save(tmp_path)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        complete_order(bob, [products[4], products[5]])
+        products[4].save()
+    assert set(RecommenderUpdate.objects.values_list('kind', 'object_id')) == {
+        (RecommenderUpdate.USER, bob.id), (RecommenderUpdate.PRODUCT, products[4].id)}
+
+    # the product's text did not change, so only the user's rows are recomputed
+    assert process_updates(tmp_path) == {'users': 1, 'products': 0, 'rows': 2}
+    assert not RecommenderUpdate.objects.exists()
+    assert Recommender.load(tmp_path).get_similar_items(products[4].id) == [products[5].id]
+
+
+def test_approximate_content_similarity_blocks_stay_sparse():
+    rng = np.random.default_rng(3)
+    content_neighbors = sparse.random(8, 8, density=0.3, random_state=3, format='csr', dtype=np.float32)
+    interactions = sparse.random(8, 5, density=0.4, random_state=4, format='csr', dtype=np.float32)
+    factors = rng.random((8, 3)).astype(np.float32)
+    positions = np.array([1, 4, 6])
+
+    block = similarity_rows(positions, None, interactions, 0.5, 0.5, content_neighbors=content_neighbors)
+    assert sparse.issparse(block)
+    expected = 0.5 * content_neighbors[positions].toarray() + 0.5 * cosine_similarity(interactions[positions],
+                                                                                      interactions)
+    assert np.allclose(block.toarray(), expected)
+    block = similarity_rows(positions, None, factors, 0.5, 0.5, content_neighbors=content_neighbors)
+    expected = 0.5 * content_neighbors[positions].toarray() + 0.5 * cosine_similarity(factors[positions], factors)
+    assert np.allclose(block, expected)
+
+
+def test_lsh_neighbors_finds_duplicate_texts():
+    rng = np.random.default_rng(2)
+    base = rng.random((50, 30)) * (rng.random((50, 30)) > 0.7)
+    X = np.vstack([base, base])
+    X = sparse.csr_matrix(X / np.linalg.norm(X, axis=1, keepdims=True))
+
+    approx = lsh_neighbors(X, k=5, bucket_size=8)
+
+    # identical vectors always share a bucket, so each copy must be its twin's best match
+    for i in range(50):
+        assert approx[i].indices[np.argmax(approx[i].data)] == i + 50
+    assert recall_report(X, approx, k=5)['recall_at_k'] > 0.5
+
+
+def test_benchmark_reports_build_and_latency_figures():
+    result = run_benchmark(300, n_users=200, n_requests=20, top_k=5)
+
+    assert result['config']['n_products'] == 300
+    assert result['n_interactions'] > 0
+    assert result['artifact_mb'] > result['index_mb'] > 0
+    for method in ('get_similar_items', 'recommend_from_seeds', 'pipeline'):
+        assert result[method]['requests'] == 20
+        assert 0 < result[method]['p50_ms'] <= result[method]['p99_ms']
+    json.dumps(result)
+
+
+@pytest.fixture
+def catalog(store_users, make_products):
+    _, buyers = store_users
+    return buyers, make_products(["Red Phone", "Blue Phone", "Phone Case", "Laptop Bag", "Novel", "Toy Car"])
+
+
+def test_update_users_refreshes_affected_rows(catalog, complete_order, tmp_path):
+    (alice, bob, _), products = catalog
+    complete_order(alice, products[:2])
+    Recommender.build(content_weight=0, collab_weight=1, top_k=3).save(tmp_path)
+
+    # bob buys the Novel together with the Toy Car, so they become collaborative neighbors
+    complete_order(bob, [products[4], products[5]])
+    assert products[5].id not in Recommender.load(tmp_path).get_similar_items(products[4].id)
+
+    assert update_users([bob.id], path=tmp_path) == 2
+    model = Recommender.load(tmp_path)
+    assert model.get_similar_items(products[4].id) == [products[5].id]
+    assert model.get_similar_items(products[0].id) == [products[1].id]
+
+
+def test_recommend_for_users_scores_the_full_catalog_per_user(catalog, complete_order):
+    (alice, bob, carol), products = catalog
+    complete_order(alice, products[:3])
+    complete_order(bob, products[2:5])
+    model = Recommender.build(top_k=4)
+
+    batch = model.recommend_for_users([alice.id, bob.id, carol.id], top_n=3, chunk_size=2)
+    # the similarity matrix is built once per model, not per call
+    assert model.item_similarity() is model.item_similarity()
+
+    for user, bought in ((alice, products[:3]), (bob, products[2:5])):
+        seeds = [p.id for p in bought]
+        assert batch[user.id] == model.recommend_from_seeds(seeds, top_n=3, available=model.available())
+    assert batch[carol.id] == []
+
+
+def test_recommendation_cache_invalidation():
+    cache = RecommendationCache(LRUCache(max_size=10, ttl=60))
+    cache.set(1, 'v1', ['a'], 10)
+    cache.set(2, 'v1', ['b'], 10)
+
+    assert cache.get(1, 'v1', 10) == ['a']
+    assert cache.get(1, 'v2', 10) is None
+
+    cache.invalidate_user(1)
+    assert cache.get(1, 'v1', 10) is None
+    assert cache.get(2, 'v1', 10) == ['b']
+
+    cache.invalidate_all()
+    assert cache.get(2, 'v1', 10) is None
+
+
+def test_recommend_for_user_is_served_from_cache(catalog, complete_order, tmp_path, django_assert_num_queries,
+                                                 django_capture_on_commit_callbacks):
+    (alice, bob, _), products = catalog
+    complete_order(alice, products[:2])
+    complete_order(bob, products[1:4])
+    Recommender.build(top_k=3).save(tmp_path)
+    model = Recommender.load(tmp_path)
+
+    first = model.recommend_for_user(alice.id)
+    with django_assert_num_queries(0):
+        assert model.recommend_for_user(alice.id) == first
+
+    # another user's incremental update publishes a new version of the same build
+    update_users([bob.id], path=tmp_path)
+    updated = Recommender.load(tmp_path)
+    assert updated.model_version != model.model_version and updated.build_version == model.build_version
+    with django_assert_num_queries(0):
+        assert updated.recommend_for_user(alice.id) == first
+
+    with django_capture_on_commit_callbacks(execute=True):
+        complete_order(alice, [products[5]])
+    # seeds and products, plus the co-purchase and category candidate queries
+    with django_assert_num_queries(6):
+        model.recommend_for_user(alice.id)
+
+
+def test_popularity_is_decayed_and_kept_up_to_date(catalog, complete_order, django_assert_num_queries,
+                                                   django_capture_on_commit_callbacks):
+    get_cache().backend.clear()
+    (alice, bob, carol), products = catalog
+    with django_capture_on_commit_callbacks(execute=True):
+        old = complete_order(alice, [products[0], products[0], products[1]])
+        Order.objects.filter(pk=old.pk).update(ordered_at=old.ordered_at - timedelta(days=30))
+        complete_order(bob, [products[1]])
+        pending = Order.objects.create(store_user=carol, total_amount=1, shipping_address="x")
+        OrderItem.objects.create(order=pending, product=products[2], quantity=1, price_at_purchase=1)
+    incremental = dict(ProductPopularity.objects.values_list('product_id', 'score'))
+    assert set(incremental) == {products[0].id, products[1].id}
+
+    with django_capture_on_commit_callbacks(execute=True):
+        pending.status = 'COMPLETED'
+        pending.save()
+    assert ProductPopularity.objects.get(product=products[2]).score > 0
+
+    # the first order was backdated after its items were recorded; a refresh rereads order times
+    assert refresh_popularity() == 3
+    # two units 30 days ago are worth less than one unit now
+    assert [p.id for p in popular_products(limit=3)] == [products[1].id, products[2].id, products[0].id]
+    with django_assert_num_queries(0):
+        popular_products(limit=3)
+    assert popular_products(category='books', limit=3) == []
+
+
+
+def test_popularity_is_rebased_onto_the_refresh_time(catalog, complete_order, settings):
+    settings.RECOMMENDER_POPULARITY_HALF_LIFE_DAYS = 1
+    get_cache().backend.clear()
+    (alice, bob, _), products = catalog
+    # over 1024 half-lives after the default epoch: 2 ** (age / half_life) overflows a float
+    now = datetime(2028, 1, 1, tzinfo=timezone.utc)
+    for buyer, product, days in [(alice, products[0], 10), (bob, products[1], 1)]:
+        order = complete_order(buyer, [product])
+        Order.objects.filter(pk=order.pk).update(ordered_at=now - timedelta(days=days))
+    assert refresh_popularity(now=now) == 2
+    assert decayed_score(ProductPopularity.objects.get(product=products[1]).score, now) == pytest.approx(0.5)
+
+    record_purchases([(products[0].id, products[0].category, 1, now + timedelta(days=1))])
+    assert decayed_score(ProductPopularity.objects.get(product=products[0]).score, now + timedelta(days=1)) == \
+        pytest.approx(1 + 2 ** -11)
+    assert [p.id for p in popular_products(limit=2)] == [products[0].id, products[1].id]
+
+def test_als_backend_scores_users_with_factors(catalog, complete_order, tmp_path):
+    (alice, bob, carol), products = catalog
+    complete_order(alice, products[:3])
+    complete_order(bob, products[1:4])
+    complete_order(carol, products[3:])
+    Recommender.build(top_k=4, backend='als', factors=4, als_iterations=5).save(tmp_path)
+
+    model = Recommender.load(tmp_path)
+    assert model.config['backend'] == 'als'
+    assert model.item_factors.shape == (6, 4)
+    batch = model.recommend_for_users([alice.id, bob.id], top_n=3)
+    for user, bought in ((alice, products[:3]), (bob, products[1:4])):
+        seeds = [p.id for p in bought]
+        assert batch[user.id] == model.recommend_from_seeds(seeds, top_n=3, available=model.available())
+    assert not set(batch[alice.id]) & {p.id for p in products[:3]}
+
+    complete_order(alice, [products[5]])
+    assert update_users([alice.id], path=tmp_path) == 4
+    updated = Recommender.load(tmp_path)
+    assert not np.array_equal(updated.item_factors[5], model.item_factors[5])
+
+
+def test_bought_together_rules_are_mined_from_baskets(catalog, complete_order, django_assert_num_queries):
+    (alice, bob, carol), products = catalog
+    p0, p1, p2 = products[:3]
+    complete_order(alice, [p0, p1, p2])
+    complete_order(bob, [p0, p1, p2])
+    complete_order(carol, [p0, p1])
+    for buyer, product in zip((alice, bob, carol), products[3:]):
+        complete_order(buyer, [product])
+
+    # six pair rules among p0, p1, p2 and one triple rule per pair; single purchases are too rare
+    assert mine_associations(triples=True) == 9
+    rule = ProductAssociation.objects.get(antecedent=p0, consequent=p1, with_product=None)
+    assert (rule.count, rule.support, rule.confidence, rule.lift, rule.rank) == (3, 0.5, 1.0, 2.0, 0)
+    triple = ProductAssociation.objects.get(antecedent=p0, with_product=p2)
+    assert (triple.consequent_id, triple.confidence) == (p1.id, 1.0)
+
+    with django_assert_num_queries(1):
+        assert [p.id for p in bought_together([p0.id])] == [p1.id, p2.id]
+    assert [p.id for p in bought_together([p0.id, p1.id])] == [p2.id]
+
+
+def test_cart_suggestions_skip_carted_and_out_of_stock_products(catalog, complete_order, tmp_path,
+                                                                django_assert_num_queries,
+                                                                django_capture_on_commit_callbacks):
+    (alice, bob, _), products = catalog
+    complete_order(alice, products[:3])
+    complete_order(bob, products[1:4])
+    model = Recommender.build(top_k=5)
+    similar = model.recommend_from_seeds([products[1].id], top_n=5)
+    sold_out = Product.objects.get(id=similar[0])
+    sold_out.quantity = 0
+    with django_capture_on_commit_callbacks(execute=True):
+        sold_out.save()
+    get_stock().sync()
+    # scored in memory, then the products
+    with django_assert_num_queries(1):
+        suggested = [p.id for p in model.recommend_for_cart([products[1].id], top_n=5)]
+    assert suggested == similar[1:]
+    assert model.recommend_for_cart([], top_n=5) == []
+
+
+def test_out_of_stock_products_are_skipped_before_ranking(catalog, complete_order, tmp_path,
+                                                          django_capture_on_commit_callbacks):
+    get_cache().backend.clear()
+    (alice, bob, carol), products = catalog
+    complete_order(alice, products[:2])
+    complete_order(bob, products[:4])
+    complete_order(carol, products[3:])
+    Recommender.build(top_k=5).save(tmp_path)
+    model = Recommender.load(tmp_path)
+    before = [p.id for p in model.recommend_for_user(alice.id, top_n=2)]
+    assert len(before) == 2
+
+    sold_out = Product.objects.get(id=before[0])
+    sold_out.quantity = 0
+    with django_capture_on_commit_callbacks(execute=True):
+        sold_out.save()
+    # the cached list is dropped and the next best product fills the gap
+    after = [p.id for p in model.recommend_for_user(alice.id, top_n=2)]
+    assert after[0] == before[1] and len(after) == 2 and sold_out.id not in after
+    seeds = [products[0].id, products[1].id]
+    batch = model.recommend_for_users([alice.id], top_n=2)[alice.id]
+    assert sold_out.id not in batch
+    assert batch == model.recommend_from_seeds(seeds, top_n=2, available=model.available())
+
+    # bulk updates bypass signals and are picked up by the next resync
+    Product.objects.filter(id=sold_out.id).update(quantity=5)
+    get_stock().sync()
+    assert model.recommend_for_users([alice.id], top_n=2)[alice.id] == model.recommend_from_seeds(seeds, top_n=2)
+
+
+def test_content_features_are_stored_and_only_changed_products_revectorized(catalog, tmp_path, monkeypatch):
+    (alice, _, _), products = catalog
+    novel, laptop_bag = products[4], products[3]
+    model = Recommender.build(content_weight=1.0, collab_weight=0.0, top_k=3)
+    assert model.build_report['content_features'] == {'products': 6, 'vectorized': 6}
+    assert ProductFeatures.objects.count() == 6
+    model.save(tmp_path)
+    assert Recommender.build(content_weight=1.0, collab_weight=0.0).build_report['content_features']['vectorized'] == 0
+
+    Review.objects.create(product=novel, reviewer=alice, rating=5, review="fits my laptop bag, a laptop bag novel")
+    assert refresh_features([novel.id, laptop_bag.id]).tolist() == [novel.id]
+    assert refresh_features([novel.id]).tolist() == []
+    # rows computed with other vectorizer settings are recomputed even if the text is the same
+    monkeypatch.setattr(features, 'VECTORIZER_TAG', features.VECTORIZER_TAG + ' n_features=1024')
+    assert refresh_features([novel.id, laptop_bag.id]).tolist() == [laptop_bag.id, novel.id]
+    monkeypatch.undo()
+
+    # the new review text is folded into the served model without a rebuild
+    assert Recommender.load(tmp_path).get_similar_items(novel.id, top_n=1) != [laptop_bag.id]
+    assert update_products([novel.id, 999], path=tmp_path) == 1
+    assert Recommender.load(tmp_path).get_similar_items(novel.id, top_n=1) == [laptop_bag.id]
+
+
+def test_build_stages_are_profiled(catalog, complete_order, tmp_path):
+    (alice, _, _), products = catalog
+    complete_order(alice, products[:2])
+    profiler = StageProfiler()
+    model = Recommender.build(top_k=3, profiler=profiler)
+
+    stages = {s['stage']: s for s in profiler.stages}
+    assert list(stages) == ['load products', 'assemble text', 'vectorize changed text', 'load interactions',
+                            'tf-idf', 'similarity + top-k', 'combine index']
+    # products plus their prefetched tags and reviews
+    assert (stages['load products']['rows'], stages['load products']['queries']) == (6, 3)
+    assert stages['load interactions']['rows'] == 2 and stages['tf-idf']['queries'] == 0
+    assert all(s['wall_s'] >= 0 and s['cpu_s'] >= 0 for s in profiler.stages)
+    assert model.build_report['stages'] == profiler.stages
+
+    assert profiler.table().splitlines()[-1].startswith('total')
+    profiler.write_json(tmp_path / 'profile.json', command='test')
+    report = json.loads((tmp_path / 'profile.json').read_text())
+    assert len(report['stages']) == 7 and report['total']['queries'] == sum(s['queries'] for s in profiler.stages)
@@ -1,15 +1,22 @@
 from django.urls import path
 from .views import (
     CartDetailView, CartItemAddView, CartItemDeleteView,
-    OrderListView, OrderDetailView, OrderCreateView
+    OrderListView, OrderDetailView, OrderCreateView,
+    RecommendationListView, PopularProductsView,
+    BoughtTogetherView, CartBoughtTogetherView,
 )
 
 urlpatterns = [
     path('cart/', CartDetailView.as_view(), name='cart-detail'),
     path('cart/add/', CartItemAddView.as_view(), name='cart-add'),
     path('cart/items/<int:pk>/delete/', CartItemDeleteView.as_view(), name='cart-item-delete'),
+    path('cart/bought-together/', CartBoughtTogetherView.as_view(), name='cart-bought-together'),
 
     path('orders/', OrderListView.as_view(), name='order-list'),
     path('orders/<int:pk>/', OrderDetailView.as_view(), name='order-detail'),
     path('orders/create/', OrderCreateView.as_view(), name='order-create'),
+
+    path('recommendations/', RecommendationListView.as_view(), name='recommendations'),
+    path('recommendations/popular/', PopularProductsView.as_view(), name='popular-products'),
+    path('recommendations/bought-together/<int:product_id>/', BoughtTogetherView.as_view(), name='bought-together'),
 ]
@@ -8,7 +8,9 @@ from .models import Cart, CartItem, Order, OrderItem
 from .serializers import CartSerializer, CartItemSerializer, OrderSerializer
 from products.models import Product
 from products.serializers import ProductSerializer
-# from orders import Recommender, build_recommender
+from .recommender.popularity import popular_products
+from .recommender.registry import get_registry
+from .recommender.serving import bought_together
 
 class CartDetailView(generics.RetrieveAPIView):
     """
@@ -31,6 +33,12 @@ class CartItemAddView(generics.CreateAPIView):
 
     @transaction.atomic
     def post(self, request, *args, **kwargs):
+        # ?suggestions=N adds N "you may also need" products for the updated cart
+        try:
+            suggestions = min(int(request.query_params.get('suggestions', 0)), 100)
+        except ValueError:
+            return Response({"detail": "suggestions must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+
         store_user = request.user.store_user
         cart, _ = Cart.objects.get_or_create(store_user=store_user)
 
@@ -48,7 +56,14 @@ class CartItemAddView(generics.CreateAPIView):
 
         cart_item.save()
         serializer = CartItemSerializer(cart_item)
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+        data = serializer.data
+
+        model = get_registry().get() if suggestions > 0 else None
+        if model is not None:
+            cart_products = list(cart.cartitem_set.values_list('product_id', flat=True))
+            products = model.recommend_for_cart(cart_products, top_n=suggestions)
+            data = dict(data, suggestions=ProductSerializer(products, many=True, context={"request": request}).data)
+        return Response(data, status=status.HTTP_201_CREATED)
 
 
 class CartItemDeleteView(generics.DestroyAPIView):
@@ -126,4 +141,61 @@ class OrderCreateView(generics.CreateAPIView):
         # Empty the cart
         cart_items.delete()
 
-        return Response(OrderSerializer(order).data, status=status.HTTP_201_CREATED)
\ No newline at end of file
+        return Response(OrderSerializer(order).data, status=status.HTTP_201_CREATED)
+
+
+class RecommendationListView(APIView):
+    """
+    Products recommended to the logged-in user by the currently published recommender model.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        model = get_registry().get()
+        if model is None:
+            return Response({"detail": "Recommender model not built yet."}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+        try:
+            top_n = min(int(request.query_params.get('top_n', 10)), 100)
+        except ValueError:
+            return Response({"detail": "top_n must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+        products = model.recommend_for_user(request.user.store_user.id, top_n=top_n)
+        serializer = ProductSerializer(products, many=True, context={"request": request})
+        return Response({"recommendations": serializer.data, "model_version": model.model_version})
+
+
+class PopularProductsView(APIView):
+    """
+    Trending products, overall or within ?category=, from the precomputed popularity table.
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request):
+        category = request.query_params.get('category') or None
+        if category and category not in dict(Product.CATEGORY_CHOICES):
+            return Response({"detail": "Unknown category."}, status=status.HTTP_400_BAD_REQUEST)
+        serializer = ProductSerializer(popular_products(category=category), many=True, context={"request": request})
+        return Response({"products": serializer.data, "category": category})
+
+
+class BoughtTogetherView(APIView):
+    """
+    Products frequently bought together with a product, from the mined association rules.
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request, product_id):
+        serializer = ProductSerializer(bought_together([product_id]), many=True, context={"request": request})
+        return Response({"products": serializer.data, "product": product_id})
+
+
+class CartBoughtTogetherView(APIView):
+    """
+    Products frequently bought together with the contents of the logged-in user's cart.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        cart_products = CartItem.objects.filter(cart__store_user=request.user.store_user).values('product_id')
+        serializer = ProductSerializer(bought_together(cart_products), many=True, context={"request": request})
+        return Response({"products": serializer.data})
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+from recommendations.models import RecommendationModel
+from recommendations.services import rollback_model
+
+class Command(BaseCommand):
+    help = "Serve a previous recommender generation again (default: the one before the active one)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--to', type=int, default=None, help="Id of the generation to activate")
+        parser.add_argument('--list', action='store_true', help="List the stored generations and exit")
+
+    def handle(self, *args, **options):
+        if options['list']:
+            for model in RecommendationModel.objects.order_by('-trained_at'):
+                state = "active" if model.is_active else ("ready" if model.completed_at else "incomplete")
+                self.stdout.write(f"{model.pk}\t{model.trained_at:%Y-%m-%d %H:%M:%S}\t{state}")
+            return
+
+        try:
+            model = rollback_model(to=options['to'])
+        except RecommendationModel.DoesNotExist as e:
+            raise CommandError(str(e) or "No such completed recommender generation")
+        self.stdout.write(self.style.SUCCESS(f"Now serving recommender generation {model.pk} ({model.trained_at})"))
@@ -1,12 +1,25 @@
 from django.core.management.base import BaseCommand
-from recommendations.services import train_recommender
+from orders.recommender.profiling import StageProfiler
+from recommendations.training import train_recommender
 
 class Command(BaseCommand):
     help = "Train the recommendation model"
 
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1,
+                            help="Processes used for the neighbor searches (-1 = all cores)")
+        parser.add_argument('--profile-json', type=str, default=None,
+                            help="Also write the per-stage time/memory/query report to this JSON file")
+
     def handle(self, *args, **kwargs):
-        model = train_recommender()
+        profiler = StageProfiler()
+        model = train_recommender(workers=kwargs['workers'], profiler=profiler)
+
         if model:
             self.stdout.write(self.style.SUCCESS("Recommender trained successfully"))
         else:
             self.stdout.write(self.style.WARNING("No training data yet"))
+        self.stdout.write(profiler.table())
+        if kwargs['profile_json']:
+            profiler.write_json(kwargs['profile_json'], command='train_recommender',
+                                generation=model.pk if model else None)
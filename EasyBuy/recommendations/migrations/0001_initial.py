@@ -0,0 +1,50 @@
+# Generated by Django 5.2.7 on 2026-10-18 15:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('core', '0004_alter_storeuser_role'),
+        ('products', '0004_review'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecommendationModel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('trained_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ProductNeighbor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('neighbor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='products.product')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='products.product')),
+                ('model', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='product_neighbors', to='recommendations.recommendationmodel')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['model', 'product', '-score'], name='product_neighbor_score_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='UserRecommendation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('model', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='user_recommendations', to='recommendations.recommendationmodel')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='user_recommendations', to='products.product')),
+                ('store_user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.storeuser')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('model', 'store_user', 'rank'), name='unique_user_recommendation_rank')],
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.7 on 2026-10-18 15:22
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def activate_latest(apps, schema_editor):
+    # models saved before generations existed were written in one transaction, so they are complete
+    RecommendationModel = apps.get_model('recommendations', 'RecommendationModel')
+    RecommendationModel.objects.update(completed_at=F('trained_at'))
+    latest = RecommendationModel.objects.order_by('-trained_at').first()
+    if latest:
+        RecommendationModel.objects.filter(pk=latest.pk).update(is_active=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommendations', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recommendationmodel',
+            name='completed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='recommendationmodel',
+            name='is_active',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(activate_latest, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='recommendationmodel',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_active', True)), fields=('is_active',), name='single_active_recommendation_model'),
+        ),
+    ]
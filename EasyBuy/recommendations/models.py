@@ -1,14 +1,55 @@
 from django.db import models
-from django.contrib.postgres.fields import JSONField  
+from core.models import StoreUser
+from products.models import Product
 
 class RecommendationModel(models.Model):
+    """
+    One trained generation. Its rows are written while it is inactive; serving only reads the
+    single active generation, so switching models is one flag update (see services.activate_model).
+    """
     trained_at = models.DateTimeField(auto_now_add=True)
+    # set once every row of the generation is written; only completed generations can be activated
+    completed_at = models.DateTimeField(null=True, blank=True)
+    is_active = models.BooleanField(default=False)
 
-    # Maps user_id → list of recommended product IDs
-    user_recommendations = JSONField(default=dict)
-
-    # For fallback CB recommendations
-    product_similarity = JSONField(default=dict)
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['is_active'], condition=models.Q(is_active=True),
+                                    name='single_active_recommendation_model'),
+        ]
 
     def __str__(self):
         return f"Recommender trained on {self.trained_at}"
+
+
+class UserRecommendation(models.Model):
+    """One recommended product of a user, rank 0 being the best."""
+    model = models.ForeignKey(RecommendationModel, on_delete=models.CASCADE, related_name='user_recommendations')
+    store_user = models.ForeignKey(StoreUser, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='user_recommendations')
+
+    class Meta:
+        # serving a user reads one contiguous range of this index
+        constraints = [
+            models.UniqueConstraint(fields=['model', 'store_user', 'rank'], name='unique_user_recommendation_rank'),
+        ]
+
+    def __str__(self):
+        return f"#{self.rank} for {self.store_user_id}: {self.product_id}"
+
+
+class ProductNeighbor(models.Model):
+    """A similar product of a product, for content-based fallback recommendations."""
+    model = models.ForeignKey(RecommendationModel, on_delete=models.CASCADE, related_name='product_neighbors')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    neighbor = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['model', 'product', '-score'], name='product_neighbor_score_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} ~ {self.neighbor_id} ({self.score:.3f})"
@@ -0,0 +1,17 @@
+from rest_framework import permissions
+
+class IsRecommendedUserOrStaff(permissions.BasePermission):
+    """
+    Custom permission: a user's recommendations reveal what they bought and reviewed,
+    so only that user (the store user in the URL) or staff can read them.
+    """
+    def has_permission(self, request, view):
+        user = request.user
+        if user.is_staff:
+            return True
+
+        # user doesn't have a store_user profile? deny
+        if not hasattr(user, "store_user"):
+            return False
+
+        return user.store_user.id == view.kwargs["user_id"]
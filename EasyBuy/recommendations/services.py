@@ -1,129 +1,93 @@
 # recommendations/services.py
 
+# Serving side: this module is imported by the views, so it must not pull in SciPy or
+# scikit-learn. Training lives in training.py.
+
 from products.models import Product
-from orders.models import OrderItem
-from django.db.models import Count
-from sklearn.metrics.pairwise import cosine_similarity
-import numpy as np
+from django.conf import settings
+from django.db import transaction
 from .models import RecommendationModel
-
-def train_recommender():
+from orders.recommender.cache import get_cache
+from orders.recommender.popularity import popular_products
+
+# recommendations / neighbors kept per user / product
+TOP_N = 10
+# recommendations stored per user, more than served so lists stay full when products run out of stock
+STORED_N = 2 * TOP_N
+# rows per INSERT when saving a model
+BATCH_SIZE = 5000
+# previous generations kept for rollback
+KEEP_MODELS = 3
+# seconds other processes may keep serving a generation after another one was activated
+ACTIVE_MODEL_TTL = 5
+ACTIVE_MODEL_KEY = "recs:active_model"
+
+
+def activate_model(model):
     """
-    Trains collaborative + content-based model and stores results in DB.
+    Atomically make a completed generation the served one, then prune old generations.
+    Used after training and for rollbacks.
     """
+    if model.completed_at is None:
+        raise ValueError(f"Recommender generation {model.pk} was never completed")
+    with transaction.atomic():
+        RecommendationModel.objects.filter(is_active=True).exclude(pk=model.pk).update(is_active=False)
+        RecommendationModel.objects.filter(pk=model.pk).update(is_active=True)
+    model.is_active = True
+    # cached responses were computed from the previous model
+    get_cache().invalidate_all()
+    _cache_active_model_id(model.pk)
+    prune_models(model)
+    return model
+
+def prune_models(active, keep=None):
+    """
+    Delete all but the `keep` (RECOMMENDER_KEEP_MODELS) newest completed generations before `active`,
+    and incomplete generations older than it. Newer incomplete ones may still be training.
+    """
+    keep = getattr(settings, "RECOMMENDER_KEEP_MODELS", KEEP_MODELS) if keep is None else keep
+    older = RecommendationModel.objects.filter(trained_at__lt=active.trained_at)
+    kept = list(older.filter(completed_at__isnull=False).order_by("-trained_at").values_list("pk", flat=True)[:keep])
+    return older.exclude(pk__in=kept).delete()
 
-    # ----------------------------------------------------
-    # STEP 1 — COLLABORATIVE FILTERING (USER → PRODUCTS)
-    # ----------------------------------------------------
-    order_items = OrderItem.objects.values("order__store_user", "product").annotate(
-        num=Count("product")
-    )
-
-    if not order_items:
-        print("No order data yet—training skipped.")
-        return None
-
-    users = sorted({i["order__store_user"] for i in order_items})
-    products = sorted({i["product"] for i in order_items})
-    user_index = {u:i for i,u in enumerate(users)}
-    product_index = {p:i for i,p in enumerate(products)}
-
-    # Build user-item matrix
-    matrix = np.zeros((len(users), len(products)))
-    for item in order_items:
-        u = user_index[item["order__store_user"]]
-        p = product_index[item["product"]]
-        matrix[u][p] += 1          # implicit feedback: #times purchased
-
-    # User similarity
-    user_sim = cosine_similarity(matrix)
-
-    user_recommendations = {}
-
-    for user in users:
-        uidx = user_index[user]
-
-        # Get similar users sorted
-        similar_users = np.argsort(-user_sim[uidx])[1:6]
-
-        # Products current user already bought
-        purchased = set(
-            OrderItem.objects.filter(order__store_user=user)
-            .values_list("product", flat=True)
-        )
-
-        recommended_ids = set()
-
-        for s in similar_users:
-            for pid, val in enumerate(matrix[s]):
-                if val > 0 and products[pid] not in purchased:
-                    recommended_ids.add(products[pid])
-
-        # Add top N
-        user_recommendations[user] = list(recommended_ids)[:10]
-
-    # ----------------------------------------------------
-    # STEP 2 — CONTENT BASED (TAGS + CATEGORY)
-    # ----------------------------------------------------
-    all_products = Product.objects.all()
-    prod_ids = [p.id for p in all_products]
-
-    # vector: [category, tags...]
-    vectors = []
-    for p in all_products:
-        tag_names = list(p.tags.values_list("caption", flat=True))
-        vec = [p.category] + tag_names
-        vectors.append(vec)
-
-    # convert to numeric features using one-hot encoding
-    all_features = list({f for v in vectors for f in v})
-    encoded = []
-
-    for v in vectors:
-        encoded.append([1 if f in v else 0 for f in all_features])
-
-    encoded = np.array(encoded)
-    sim = cosine_similarity(encoded)
-
-    product_similarity = {}
-    for i,pid in enumerate(prod_ids):
-        # top 10 similar
-        top = np.argsort(-sim[i])[1:11]
-        product_similarity[pid] = [prod_ids[j] for j in top]
-
-    # ----------------------------------------------------
-    # Step 3 — Save trained model
-    # ----------------------------------------------------
-    RecommendationModel.objects.all().delete()
-
-    return RecommendationModel.objects.create(
-        user_recommendations=user_recommendations,
-        product_similarity=product_similarity,
-    )
+def rollback_model(to=None):
+    """
+    Serve the generation with id `to`, by default the newest completed one trained before the
+    active one. Returns the activated generation.
+    """
+    completed = RecommendationModel.objects.filter(completed_at__isnull=False)
+    if to is not None:
+        return activate_model(completed.get(pk=to))
+    active = completed.get(is_active=True)
+    previous = completed.filter(trained_at__lt=active.trained_at).order_by("-trained_at").first()
+    if previous is None:
+        raise RecommendationModel.DoesNotExist("No earlier recommender generation to roll back to")
+    return activate_model(previous)
+
+def _cache_active_model_id(pk):
+    ttl = getattr(settings, "RECOMMENDER_ACTIVE_MODEL_TTL", ACTIVE_MODEL_TTL)
+    get_cache().backend.set(ACTIVE_MODEL_KEY, pk or 0, timeout=ttl)
+
+def active_model_id():
+    """
+    Primary key of the served generation, None before the first training. Read from the
+    recommendation cache, so warm requests don't query it; activate_model updates the cached
+    id, other processes (with a per-process cache) read it again after RECOMMENDER_ACTIVE_MODEL_TTL.
+    """
+    pk = get_cache().backend.get(ACTIVE_MODEL_KEY)
+    if pk is None:
+        pk = RecommendationModel.objects.filter(is_active=True).values_list("pk", flat=True).first()
+        _cache_active_model_id(pk)
+    return pk or None
 
 def get_recommendations_for_user(user_id):
-    model = RecommendationModel.objects.order_by("-trained_at").first()
-    if not model:
-        return Product.objects.all()[:10]  # nothing trained yet
-
-    # -------------------------
-    # 1. User Cold Start
-    # -------------------------
-    if str(user_id) not in model.user_recommendations:
-        # Recommend trending products
-        trending = (
-            OrderItem.objects.values("product")
-            .annotate(cnt=Count("product"))
-            .order_by("-cnt")[:10]
-        )
-        product_ids = [t["product"] for t in trending]
-        return Product.objects.filter(id__in=product_ids)
-
-    # Collaborative output
-    cf_products = model.user_recommendations[str(user_id)]
-
-    if not cf_products:
-        # fallback: popular items
-        return Product.objects.all()[:10]
-
-    return Product.objects.filter(id__in=cf_products)
+    # one indexed query over the active generation's rows of this user, best in-stock ones first
+    products = list(
+        Product.objects.filter(user_recommendations__model__is_active=True,
+                               user_recommendations__store_user_id=user_id, quantity__gt=0)
+        .order_by("user_recommendations__rank")[:TOP_N]
+    )
+    if not products:
+        # cold start, nothing trained yet or nothing left to recommend: trending products
+        return popular_products(limit=TOP_N)
+    return products
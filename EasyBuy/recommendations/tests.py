@@ -1,3 +1,120 @@
-from django.test import TestCase
+import time
 
-# Create your tests here.
+import pytest
+from rest_framework.test import APIClient
+from django.contrib.auth.models import User
+from products.models import Product
+from recommendations.models import ProductNeighbor, RecommendationModel, UserRecommendation
+from recommendations.services import get_recommendations_for_user, rollback_model
+from recommendations.training import train_recommender
+from orders.recommender.stock import get_stock
+
+@pytest.fixture
+def buyers_and_products(store_users, make_products):
+    _, buyers = store_users
+    return buyers, make_products([f"Product {i}" for i in range(5)], ["books", "books", "toys", "toys", "books"])
+
+def test_trained_recommendations_are_served_from_rows(buyers_and_products, complete_order,
+                                                      django_assert_num_queries):
+    (alice, bob, carol), products = buyers_and_products
+    complete_order(alice, products[:2])
+    complete_order(bob, products[:3])
+    complete_order(carol, [products[0], products[3]])
+    train_recommender()
+
+    # bob is alice's closest neighbor, so his third product ranks above carol's
+    with django_assert_num_queries(1):
+        assert [p.id for p in get_recommendations_for_user(alice.id)] == [products[2].id, products[3].id]
+    neighbors = ProductNeighbor.objects.filter(product=products[0]).order_by("-score")
+    assert [n.neighbor_id for n in neighbors] == [products[1].id, products[4].id]
+
+    # out-of-stock products are skipped in the same query
+    Product.objects.filter(id=products[2].id).update(quantity=0)
+    assert [p.id for p in get_recommendations_for_user(alice.id)] == [products[3].id]
+
+def test_generations_are_activated_atomically_and_can_roll_back(buyers_and_products, complete_order,
+                                                                settings):
+    settings.RECOMMENDER_KEEP_MODELS = 2
+    (alice, bob, _), products = buyers_and_products
+    complete_order(alice, products[:2])
+    complete_order(bob, products[:3])
+    first = train_recommender()
+    assert [p.id for p in get_recommendations_for_user(alice.id)] == [products[2].id]
+
+    # an interrupted training leaves an incomplete generation that is never served
+    RecommendationModel.objects.create()
+    assert [p.id for p in get_recommendations_for_user(alice.id)] == [products[2].id]
+
+    complete_order(bob, [products[3]])
+    generations = [first] + [train_recommender() for _ in range(3)]
+    assert RecommendationModel.objects.get(is_active=True) == generations[-1]
+    assert [p.id for p in get_recommendations_for_user(alice.id)] == [products[2].id, products[3].id]
+    # the two previous completed generations are kept, older and abandoned ones are dropped
+    assert set(RecommendationModel.objects.all()) == set(generations[1:])
+    assert not UserRecommendation.objects.filter(model=first).exists()
+
+    assert rollback_model() == generations[2]
+    assert RecommendationModel.objects.get(is_active=True) == generations[2]
+    assert rollback_model(to=generations[3].pk).is_active
+
+def test_view_serves_the_active_generation_without_process_wide_invalidation(buyers_and_products,
+                                                                             complete_order, settings):
+    settings.RECOMMENDER_ACTIVE_MODEL_TTL = 0.05
+    (alice, bob, _), products = buyers_and_products
+    complete_order(alice, products[:2])
+    complete_order(bob, products[:3])
+    first = train_recommender()
+    complete_order(bob, [products[3]])
+    second = train_recommender()
+    client = APIClient()
+    client.force_authenticate(alice.user)
+    url = f"/recommendations/user/{alice.id}/"
+    assert [p["name"] for p in client.get(url).data["recommended_products"]] == ["Product 2", "Product 3"]
+
+    # a rollback run by the management command cannot clear this process's cache
+    RecommendationModel.objects.filter(pk=second.pk).update(is_active=False)
+    RecommendationModel.objects.filter(pk=first.pk).update(is_active=True)
+    time.sleep(0.1)
+    assert [p["name"] for p in client.get(url).data["recommended_products"]] == ["Product 2"]
+
+def test_warm_view_requests_do_not_query_the_db(buyers_and_products, complete_order,
+                                                django_assert_num_queries):
+    (alice, bob, _), products = buyers_and_products
+    complete_order(alice, products[:2])
+    complete_order(bob, products[:3])
+    train_recommender()
+    client = APIClient()
+    client.force_authenticate(alice.user)
+    url = f"/recommendations/user/{alice.id}/"
+    expected = client.get(url).data
+    # stock is resynced every few seconds, not per request
+    get_stock().sync()
+    with django_assert_num_queries(0):
+        assert client.get(url).data == expected
+
+def test_view_drops_cached_responses_with_sold_out_products(buyers_and_products, complete_order):
+    (alice, bob, _), products = buyers_and_products
+    complete_order(alice, products[:2])
+    complete_order(bob, products[:4])
+    train_recommender()
+    client = APIClient()
+    client.force_authenticate(alice.user)
+    url = f"/recommendations/user/{alice.id}/"
+    assert [p["name"] for p in client.get(url).data["recommended_products"]] == ["Product 2", "Product 3"]
+
+    Product.objects.filter(pk=products[2].pk).update(quantity=0)
+    get_stock().sync()
+    assert [p["name"] for p in client.get(url).data["recommended_products"]] == ["Product 3"]
+
+def test_view_only_serves_the_user_themselves_or_staff(buyers_and_products, complete_order):
+    (alice, bob, _), products = buyers_and_products
+    complete_order(alice, products[:2])
+    client = APIClient()
+    url = f"/recommendations/user/{alice.id}/"
+    client.force_authenticate(bob.user)
+    assert client.get(url).status_code == 403
+
+    client.force_authenticate(User.objects.create_user(username="staff", password="pw", is_staff=True))
+    assert client.get(url).status_code == 200
+    client.force_authenticate(alice.user)
+    assert client.get(url).status_code == 200
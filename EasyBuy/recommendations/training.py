@@ -0,0 +1,118 @@
+# recommendations/training.py
+
+from products.models import Product
+from orders.models import OrderItem
+import numpy as np
+from scipy import sparse
+from django.utils import timezone
+from .models import ProductNeighbor, RecommendationModel, UserRecommendation
+from .services import BATCH_SIZE, STORED_N, TOP_N, activate_model
+from orders.recommender.index import NeighborIndex, top_n_per_row
+from orders.recommender.interactions import CHUNK_SIZE, interaction_matrix
+from orders.recommender.profiling import StageProfiler
+from orders.recommender.similarity import top_k_cosine
+
+# similar users whose purchases are recommended
+SIMILAR_USERS = 5
+
+
+def _rows_to_csr(ids, rows):
+    """(positions, scores) neighbor rows as a square sparse matrix."""
+    index = NeighborIndex.from_rows(ids, rows)
+    return sparse.csr_matrix((index.scores, index.indices, index.indptr), shape=(len(ids), len(ids)))
+
+
+def train_recommender(workers=1, profiler=None):
+    """
+    Trains collaborative + content-based model and stores results in DB.
+    Reads the DB with three streaming queries; everything else is sparse matrix algebra.
+    workers: processes used for the neighbor searches (-1 = all cores)
+    profiler: optional StageProfiler recording the time, memory and queries of every stage
+    """
+    profiler = profiler or StageProfiler()
+
+    # ----------------------------------------------------
+    # STEP 1 — COLLABORATIVE FILTERING (USER → PRODUCTS)
+    # ----------------------------------------------------
+    with profiler.stage("load purchases") as stage:
+        pairs = np.array(list(
+            OrderItem.objects.filter(product__isnull=False)
+            .values_list("order__store_user_id", "product_id")
+            .iterator(chunk_size=CHUNK_SIZE)
+        ), dtype=np.int64).reshape(-1, 2)
+        stage["rows"] = len(pairs)
+
+    if not len(pairs):
+        print("No order data yet—training skipped.")
+        return None
+
+    with profiler.stage("user similarity") as stage:
+        users = np.unique(pairs[:, 0])
+        products = np.unique(pairs[:, 1])
+        # implicit feedback: #times purchased
+        matrix = interaction_matrix(np.column_stack([pairs, np.ones(len(pairs), dtype=np.int64)]), users, products)
+
+        # User similarity: each user's most similar other users, weighted by similarity.
+        # Users are compared one block at a time and only the top ones are kept, so memory
+        # stays bounded instead of growing with users x users
+        similar_users = _rows_to_csr(users, top_k_cosine(matrix, SIMILAR_USERS, workers=workers))
+        stage["rows"] = len(users)
+
+    with profiler.stage("score users") as stage:
+        # products bought by similar users that the user hasn't bought, best scored first
+        purchased = (matrix > 0).astype(np.float32)
+        scores = (similar_users @ purchased).tocsr()
+        scores = (scores - scores.multiply(purchased)).tocsr()
+        top = top_n_per_row(scores.indptr, scores.indices, scores.data, STORED_N)
+        user_recommendations = [
+            UserRecommendation(store_user_id=user, rank=rank, product_id=product)
+            for user, positions in zip(users.tolist(), top)
+            for rank, product in enumerate(products[positions].tolist())
+        ]
+        stage["rows"] = len(user_recommendations)
+
+    # ----------------------------------------------------
+    # STEP 2 — CONTENT BASED (TAGS + CATEGORY)
+    # ----------------------------------------------------
+    with profiler.stage("load products") as stage:
+        product_rows = list(Product.objects.order_by("id").values_list("id", "category"))
+        tag_rows = list(Product.tags.through.objects.values_list("product_id", "tag__caption"))
+        prod_ids = np.array([pid for pid, _ in product_rows], dtype=np.int64)
+        stage["rows"] = len(product_rows) + len(tag_rows)
+
+    with profiler.stage("product similarity") as stage:
+        # sparse one-hot encoding of [category, tags...]
+        feature_products = np.array([pid for pid, _ in product_rows + tag_rows], dtype=np.int64)
+        features, columns = np.unique([f for _, f in product_rows + tag_rows], return_inverse=True)
+        encoded = sparse.csr_matrix(
+            (np.ones(len(columns), dtype=np.float32), (np.searchsorted(prod_ids, feature_products), columns)),
+            shape=(len(prod_ids), len(features)),
+        )
+        encoded.data[:] = 1
+
+        # top 10 similar, one block of the similarity matrix at a time
+        neighbors = top_k_cosine(encoded, TOP_N, workers=workers)
+        product_neighbors = [
+            ProductNeighbor(product_id=pid, neighbor_id=neighbor, score=score)
+            for pid, (positions, scores) in zip(prod_ids.tolist(), neighbors)
+            for neighbor, score in zip(prod_ids[positions].tolist(), scores.tolist())
+        ]
+        stage["rows"] = len(product_neighbors)
+
+    # ----------------------------------------------------
+    # Step 3 — Save trained model
+    # ----------------------------------------------------
+    # rows are written into an inactive generation, so serving keeps reading the active one
+    # until activate_model flips the flag; a crash here leaves an incomplete, never served generation
+    with profiler.stage("save") as stage:
+        model = RecommendationModel.objects.create()
+        for row in user_recommendations + product_neighbors:
+            row.model = model
+        UserRecommendation.objects.bulk_create(user_recommendations, batch_size=BATCH_SIZE)
+        ProductNeighbor.objects.bulk_create(product_neighbors, batch_size=BATCH_SIZE)
+        model.completed_at = timezone.now()
+        model.save(update_fields=["completed_at"])
+        stage["rows"] = len(user_recommendations) + len(product_neighbors)
+    with profiler.stage("activate"):
+        activate_model(model)
+    return model
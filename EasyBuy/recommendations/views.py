@@ -1,15 +1,31 @@
 from rest_framework.views import APIView
+from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from products.serializers import ProductSerializer
-from .services import get_recommendations_for_user
+from .permissions import IsRecommendedUserOrStaff
+from .services import active_model_id, get_recommendations_for_user
 from products.models import Product
-from .models import RecommendationModel
+from orders.recommender.cache import get_cache
+from orders.recommender.stock import get_stock
 
 class UserRecommendationView(APIView):
+    permission_classes = [IsAuthenticated, IsRecommendedUserOrStaff]
+
     def get(self, request, user_id):
-        products = get_recommendations_for_user(user_id)
-        serializer = ProductSerializer(products, many=True)
-        return Response({"recommended_products": serializer.data})
+        # serialized responses are cached per served generation until the user buys/reviews something;
+        # keying by generation makes a training or rollback in another process visible once
+        # active_model_id() reads it again
+        cache = get_cache()
+        generation = active_model_id()
+        cached = cache.get(user_id, generation, 'view')
+        if cached is not None and not get_stock().all_available(cached[0]):
+            # cached before some of these products ran out of stock
+            cached = None
+        if cached is None:
+            products = get_recommendations_for_user(user_id)
+            cached = ([p.id for p in products], ProductSerializer(products, many=True).data)
+            cache.set(user_id, generation, cached, 'view')
+        return Response({"recommended_products": cached[1]})
     
 # class RecommendView(APIView):
     # permission_classes = [IsAuthenticated]